@@ -4,8 +4,9 @@ Database connection and configuration.
 
 import sqlite3
 import os
+import threading
 from contextlib import contextmanager
-from typing import Generator
+from typing import Generator, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -41,8 +42,13 @@ if USE_MYSQL:
 else:
     logger.info(f"Using SQLite database: {DB_PATH}")
 
-def init_database():
-    """Initialize the database with required tables."""
+def init_database(sqlite_conn: Optional[sqlite3.Connection] = None):
+    """
+    Initialize the database with required tables.
+    
+    Args:
+        sqlite_conn: Open SQLite connection to reuse instead of opening one (ignored for MySQL)
+    """
     try:
         if USE_MYSQL:
             # MySQL initialization
@@ -176,8 +182,8 @@ def init_database():
                     logger.info("Default regular user created")
         else:
             # SQLite initialization (existing code)
-            with sqlite3.connect(DB_PATH) as conn:
-                cursor = conn.cursor()
+            conn = sqlite_conn if sqlite_conn is not None else sqlite3.connect(DB_PATH)
+            cursor = conn.cursor()
             
             # Create subscription_plans table
             cursor.execute('''
@@ -293,6 +299,18 @@ def init_database():
                 ON user_daily_usage(user_id, usage_date)
             ''')
             
+            # Create index for the active-subscription lookup
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_subscriptions_active 
+                ON user_subscriptions(user_id, status, end_date)
+            ''')
+            
+            # Create index for date-bounded payment reporting queries
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_payments_status_created 
+                ON payments(status, created_at)
+            ''')
+            
             conn.commit()
             logger.info("Database initialized successfully")
             
@@ -468,6 +486,69 @@ def get_db_connection():
             if conn:
                 conn.close()
 
+# Per-thread SQLite connections reused across requests (read-only and read-write)
+_thread_local = threading.local()
+
+def _get_thread_sqlite_connection(attr: str, read_only: bool) -> sqlite3.Connection:
+    """Return this thread's cached SQLite connection, opening it on first use."""
+    conn = getattr(_thread_local, attr, None)
+    if conn is None:
+        if read_only:
+            conn = sqlite3.connect(f"file:{os.path.abspath(DB_PATH)}?mode=ro", uri=True)
+        else:
+            conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        conn.execute('PRAGMA cache_size = -20000')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        setattr(_thread_local, attr, conn)
+    return conn
+
+@contextmanager
+def _thread_sqlite_connection(attr: str, read_only: bool):
+    """Yield this thread's cached connection, discarding it after SQLite errors."""
+    conn = _get_thread_sqlite_connection(attr, read_only)
+    try:
+        yield conn
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        if isinstance(e, sqlite3.Error):
+            # Drop the cached connection so the next caller reopens a fresh one
+            setattr(_thread_local, attr, None)
+            conn.close()
+        else:
+            conn.rollback()
+        raise
+
+@contextmanager
+def get_read_connection():
+    """Get a long-lived, per-thread read-only connection for analytics queries."""
+    if USE_MYSQL:
+        with get_db_connection() as conn:
+            yield conn
+        return
+    
+    with _thread_sqlite_connection('read_conn', read_only=True) as conn:
+        yield conn
+
+@contextmanager
+def get_thread_connection():
+    """
+    Get a long-lived, per-thread read-write connection for hot request paths.
+    
+    The connection (and SQLite's prepared statement cache) outlives the
+    request; callers must commit their own writes. Uncommitted work is rolled
+    back if the block raises.
+    """
+    if USE_MYSQL:
+        with get_db_connection() as conn:
+            yield conn
+        return
+    
+    with _thread_sqlite_connection('write_conn', read_only=False) as conn:
+        yield conn
+
 def execute_query(query: str, params: tuple = None, fetch_one: bool = False, fetch_all: bool = False):
     """Execute a database query."""
     with get_db_connection() as conn:
@@ -0,0 +1,133 @@
+"""
+Connection and backup helpers shared by the one-shot database scripts (schema updates, table fixes, admin setup).
+"""
+
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Generator, Optional
+
+from app.database.connection import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Buffer size for streaming backups in and out of gzip
+COPY_CHUNK_SIZE = 1024 * 1024
+# Files SQLite keeps beside the database while a transaction or WAL is open
+SQLITE_SIDECAR_SUFFIXES = ('-journal', '-wal', '-shm')
+
+@contextmanager
+def migration_connection(exclusive: bool = False) -> Generator[sqlite3.Connection, None, None]:
+    """
+    Open a SQLite connection tuned for a short-lived maintenance script.
+
+    Args:
+        exclusive: Hold the database lock until the connection closes. Only for
+            scripts that own the file for their whole run, never alongside the app.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.row_factory = sqlite3.Row
+        # Scripts back up first, so trade per-commit durability for speed.
+        # journal_mode is left alone: it persists in the file the app keeps using.
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -65536")
+        if exclusive:
+            # Keep the lock instead of re-acquiring it per statement
+            conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def backup_database() -> Optional[str]:
+    """Create a gzipped backup of the database before updating; returns its path, or None on failure."""
+    try:
+        # Reuse the newest backup if the database hasn't been modified since it was taken
+        existing_backups = glob.glob(f"{DB_PATH}.backup_*.gz")
+        if existing_backups:
+            latest_backup = max(existing_backups, key=os.path.getmtime)
+            if os.path.getmtime(DB_PATH) <= os.path.getmtime(latest_backup):
+                logger.info(f"Database unchanged since last backup: {latest_backup}")
+                return latest_backup
+        
+        backup_path = f"{DB_PATH}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.gz"
+        snapshot_path = f"{backup_path}.tmp"
+        
+        try:
+            # Snapshot through SQLite's online backup (consistent even with a concurrent
+            # writer), page by page into a temporary file so the database never has to
+            # fit in memory
+            src = sqlite3.connect(DB_PATH)
+            dst = sqlite3.connect(snapshot_path)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+            
+            # Level 1 shrinks the mostly-empty pages at little CPU cost. Written under a
+            # temporary name so a half-written file is never picked up for reuse above.
+            with open(snapshot_path, 'rb') as raw, gzip.open(f"{backup_path}.part", 'wb', compresslevel=1) as gz:
+                shutil.copyfileobj(raw, gz, COPY_CHUNK_SIZE)
+            os.replace(f"{backup_path}.part", backup_path)
+        finally:
+            for leftover in (snapshot_path, f"{backup_path}.part"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        
+        logger.info(f"Database backed up to: {backup_path}")
+        return backup_path
+    except Exception as e:
+        logger.error(f"Error creating backup: {str(e)}")
+        return None
+
+def restore_database(backup_path: str) -> None:
+    """Restore the database from a backup, gzipped or a plain copy. Stop the application first."""
+    with open(backup_path, 'rb') as raw:
+        is_gzip = raw.read(2) == b'\x1f\x8b'
+    
+    restore_path = f"{DB_PATH}.restore"
+    opener = gzip.open if is_gzip else open
+    try:
+        with opener(backup_path, 'rb') as src, open(restore_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        
+        # A journal or WAL left by the replaced database would be replayed onto the restored one
+        for suffix in SQLITE_SIDECAR_SUFFIXES:
+            sidecar = f"{DB_PATH}{suffix}"
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+        os.replace(restore_path, DB_PATH)
+    finally:
+        if os.path.exists(restore_path):
+            os.remove(restore_path)
+    logger.info(f"Database restored from: {backup_path}")
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Back up or restore the SQLite database.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('backup', help="Write a gzipped backup next to the database")
+    restore_parser = subparsers.add_parser('restore', help="Replace the database with a backup (stop the app first)")
+    restore_parser.add_argument('backup_path', help="Backup file, gzipped or a plain copy")
+    args = parser.parse_args()
+    
+    if args.command == 'backup':
+        path = backup_database()
+        if not path:
+            print("❌ Failed to create backup.")
+            raise SystemExit(1)
+        print(f"💾 Backup saved at: {path}")
+    else:
+        restore_database(args.backup_path)
+        print(f"✓ Database restored from: {args.backup_path}")
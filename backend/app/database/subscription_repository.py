@@ -1,4 +1,8 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
 from app.database.connection import get_db_connection
+from app.models.subscription import UserSubscription, SubscriptionStatus
 
 class SubscriptionRepository:
     @staticmethod
@@ -9,3 +13,43 @@ class SubscriptionRepository:
             cursor.execute("SELECT status, COUNT(*) as count FROM subscriptions GROUP BY status")
             rows = cursor.fetchall()
             return {row['status']: row['count'] for row in rows}
+    
+    @staticmethod
+    def get_active_for_user(user_id: int) -> Optional[UserSubscription]:
+        """Get the user's subscription that is active today, served by idx_user_subscriptions_active."""
+        today = date.today().isoformat()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM user_subscriptions
+                WHERE user_id = ? AND status = 'active' AND end_date >= ? AND start_date <= ?
+                ORDER BY end_date DESC
+                LIMIT 1
+            ''', (user_id, today, today))
+            row = cursor.fetchone()
+            return SubscriptionRepository._row_to_subscription(row) if row else None
+    
+    @staticmethod
+    def _row_to_subscription(row) -> UserSubscription:
+        """Convert database row to UserSubscription object."""
+        def parse_timestamp(value):
+            if not value or isinstance(value, datetime):
+                return value or None
+            return datetime.fromisoformat(value)
+        
+        return UserSubscription(
+            id=row['id'],
+            user_id=row['user_id'],
+            plan_id=row['plan_id'],
+            start_date=date.fromisoformat(str(row['start_date'])[:10]),
+            end_date=date.fromisoformat(str(row['end_date'])[:10]),
+            status=SubscriptionStatus(row['status']),
+            auto_renew=bool(row['auto_renew']),
+            custom_duration_days=row['custom_duration_days'],
+            total_amount=Decimal(str(row['total_amount'])),
+            currency=row['currency'] or 'USD',
+            created_at=parse_timestamp(row['created_at']),
+            updated_at=parse_timestamp(row['updated_at']),
+            cancelled_at=parse_timestamp(row['cancelled_at']),
+            cancellation_reason=row['cancellation_reason']
+        )
@@ -121,3 +121,24 @@ class UsageRepository:
                 cursor.execute('DELETE FROM user_daily_usage')
                 conn.commit()
             logger.info('Reset all user daily usage counts.')
+
+    @staticmethod
+    def prune_usage_before(cutoff_date: str) -> int:
+        """Delete usage rows dated before cutoff_date (YYYY-MM-DD); returns the number removed."""
+        with get_db_connection() as conn:
+            if USE_MYSQL:
+                # MySQL version
+                from sqlalchemy import text
+                result = conn.execute(text('''
+                    DELETE FROM user_daily_usage WHERE usage_date < :cutoff_date
+                '''), {'cutoff_date': cutoff_date})
+                conn.commit()
+                removed = result.rowcount
+            else:
+                # SQLite version
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM user_daily_usage WHERE usage_date < ?', (cutoff_date,))
+                conn.commit()
+                removed = cursor.rowcount
+            logger.info(f'Pruned {removed} daily usage rows before {cutoff_date}.')
+            return removed
@@ -3,10 +3,18 @@ Code execution request and response models.
 """
 
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import re
 import html
 
+def _normalize_text(text: str) -> str:
+    """Remove null bytes and normalize line endings, skipping passes that would be no-ops."""
+    if '\x00' in text:
+        text = text.replace('\x00', '')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
 @dataclass
 class ExecutionRequest:
     """Model for code execution requests."""
@@ -33,7 +41,7 @@ class ExecutionRequest:
         # Validate code
         if not self.code or not isinstance(self.code, str):
             errors.append("Code is required and must be a string")
-        elif len(self.code.strip()) == 0:
+        elif self.code.isspace():
             errors.append("Code cannot be empty")
         elif len(self.code) > 50000:  # 50KB limit
             errors.append("Code is too long (maximum 50,000 characters)")
@@ -65,12 +73,12 @@ class ExecutionRequest:
             New ExecutionRequest with sanitized data
         """
         # Sanitize code - remove null bytes and normalize line endings
-        sanitized_code = self.code.replace('\x00', '').replace('\r\n', '\n').replace('\r', '\n')
+        sanitized_code = _normalize_text(self.code)
         
         # Sanitize input if provided
         sanitized_input = None
         if self.input is not None:
-            sanitized_input = self.input.replace('\x00', '').replace('\r\n', '\n').replace('\r', '\n')
+            sanitized_input = _normalize_text(self.input)
         
         # Sanitize language - lowercase and strip
         sanitized_language = self.language.lower().strip()
@@ -81,6 +89,18 @@ class ExecutionRequest:
             input=sanitized_input,
             timeout=self.timeout
         )
+    
+    def validate_and_sanitize(self) -> Tuple[bool, List[str], Optional['ExecutionRequest']]:
+        """
+        Validate the request and, if valid, sanitize it.
+        
+        Returns:
+            Tuple of (valid, errors, sanitized request or None)
+        """
+        validation = self.validate()
+        if not validation['valid']:
+            return False, validation['errors'], None
+        return True, [], self.sanitize()
 
 @dataclass
 class ExecutionResult:
@@ -3,16 +3,35 @@ User model for authentication and user management.
 """
 
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 import bcrypt
 import secrets
 from dataclasses import dataclass
 from enum import Enum
 
+# argon2id is preferred for new hashes; bcrypt hashes remain verifiable
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHash, VerificationError
+    _argon2_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+except ImportError:
+    _argon2_hasher = None
+
 class UserRole(Enum):
     STUDENT = "student"
     EDITOR = "editor"
     ADMIN = "admin"
+    
+    @property
+    def level(self) -> int:
+        """Position in the role hierarchy (higher includes lower)."""
+        return ROLE_LEVELS[self]
+
+ROLE_LEVELS = {
+    UserRole.STUDENT: 1,
+    UserRole.EDITOR: 2,
+    UserRole.ADMIN: 3
+}
 
 @dataclass
 class User:
@@ -51,13 +70,38 @@ class User:
     
     @staticmethod
     def hash_password(password: str) -> str:
-        """Hash a password using bcrypt."""
+        """Hash a password using argon2id (bcrypt if argon2-cffi is not installed)."""
+        if _argon2_hasher is not None:
+            return _argon2_hasher.hash(password)
         salt = bcrypt.gensalt()
         return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
     
+    @staticmethod
+    def verify_password_hash(password: Union[str, bytes], password_hash: str) -> bool:
+        """Verify a password (str or UTF-8 bytes) against an argon2 or legacy bcrypt hash."""
+        if isinstance(password, str):
+            password = password.encode('utf-8')
+        if password_hash.startswith('$argon2'):
+            if _argon2_hasher is None:
+                return False
+            try:
+                return _argon2_hasher.verify(password_hash, password)
+            except (VerificationError, InvalidHash):
+                return False
+        return bcrypt.checkpw(password, password_hash.encode('utf-8'))
+    
+    @staticmethod
+    def password_needs_rehash(password_hash: str) -> bool:
+        """Check if a stored hash should be upgraded to the current argon2 parameters."""
+        if _argon2_hasher is None:
+            return False
+        if not password_hash.startswith('$argon2'):
+            return True
+        return _argon2_hasher.check_needs_rehash(password_hash)
+    
     def verify_password(self, password: str) -> bool:
         """Verify a password against the stored hash."""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return self.verify_password_hash(password, self.password_hash)
     
     def update_last_login(self):
         """Update the last login timestamp."""
@@ -575,6 +575,7 @@ def create_plan():
         plan_id = PlanRepository.create_plan(data)
         
         if plan_id:
+            payment_service.invalidate_plans_cache()
             logger.info(f"Admin {admin_user['user_id']} created new plan: {data['name']} (ID: {plan_id})")
             return jsonify({
                 'success': True,
@@ -613,6 +614,7 @@ def update_plan(plan_id):
         success = PlanRepository.update_plan(plan_id, data)
         
         if success:
+            payment_service.invalidate_plans_cache()
             logger.info(f"Admin {admin_user['user_id']} updated plan {plan_id}")
             return jsonify({
                 'success': True,
@@ -643,6 +645,7 @@ def toggle_plan_status(plan_id):
         success = PlanRepository.toggle_plan_status(plan_id)
         
         if success:
+            payment_service.invalidate_plans_cache()
             logger.info(f"Admin {admin_user['user_id']} toggled status for plan {plan_id}")
             return jsonify({
                 'success': True,
@@ -673,6 +676,7 @@ def delete_plan(plan_id):
         success = PlanRepository.delete_plan(plan_id)
         
         if success:
+            payment_service.invalidate_plans_cache()
             logger.info(f"Admin {admin_user['user_id']} deleted plan {plan_id}")
             return jsonify({
                 'success': True,
@@ -698,8 +702,9 @@ def get_revenue_analytics():
     """Get comprehensive revenue analytics data with charts."""
     try:
         period = request.args.get('period', 'monthly')
+        window = request.args.get('window', 'all')
         
-        analytics = admin_service.get_revenue_analytics(period)
+        analytics = admin_service.get_revenue_analytics(period, window)
         
         return jsonify({
             'success': True,
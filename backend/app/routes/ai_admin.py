@@ -3,6 +3,9 @@ Admin routes for AI service management and monitoring.
 """
 
 import logging
+import time
+from datetime import datetime
+from typing import Optional
 from flask import Blueprint, jsonify, request
 from app.services.enhanced_ai_service import enhanced_ai_service
 from app.middleware.rate_limiter import rate_limit
@@ -12,6 +15,12 @@ logger = logging.getLogger(__name__)
 # Create admin blueprint
 ai_admin_bp = Blueprint('ai_admin', __name__)
 
+def _monotonic_isoformat(timestamp: Optional[float]) -> Optional[str]:
+    """Convert a time.monotonic() timestamp from the AI service to a wall-clock ISO string."""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(time.time() - (time.monotonic() - timestamp)).isoformat()
+
 @ai_admin_bp.route('/ai/status')
 @rate_limit(requests_per_minute=30, requests_per_hour=200)
 def get_ai_status():
@@ -83,14 +92,14 @@ def get_provider_status(provider: str):
         # Add detailed key information (without exposing actual keys)
         if provider in enhanced_ai_service.api_keys:
             keys_info = []
-            for i, key in enumerate(enhanced_ai_service.api_keys[provider]):
+            for key in enhanced_ai_service.api_keys[provider]:
                 keys_info.append({
-                    'key_id': i,
+                    'key_id': key.key_id,
                     'is_active': key.is_active,
                     'failure_count': key.failure_count,
-                    'last_failure': key.last_failure.isoformat() if key.last_failure else None,
-                    'last_success': key.last_success.isoformat() if key.last_success else None,
-                    'rate_limit_reset': key.rate_limit_reset.isoformat() if key.rate_limit_reset else None,
+                    'last_failure': _monotonic_isoformat(key.last_failure),
+                    'last_success': _monotonic_isoformat(key.last_success),
+                    'rate_limit_reset': _monotonic_isoformat(key.rate_limit_reset),
                     'total_requests': key.total_requests,
                     'successful_requests': key.successful_requests,
                     'success_rate': key.successful_requests / max(key.total_requests, 1)
@@ -115,8 +124,7 @@ def get_provider_status(provider: str):
 def clear_ai_cache():
     """Clear AI service cache."""
     try:
-        cache_size = len(enhanced_ai_service.cache)
-        enhanced_ai_service.cache.clear()
+        cache_size = enhanced_ai_service.clear_cache()
         
         logger.info(f"AI cache cleared, removed {cache_size} entries")
         
@@ -184,7 +192,7 @@ def get_ai_config():
         return jsonify({
             'success': True,
             'config': config,
-            'cache_ttl_minutes': enhanced_ai_service.cache_ttl.total_seconds() / 60
+            'cache_ttl_minutes': enhanced_ai_service.cache_ttl_s / 60
         })
         
     except Exception as e:
@@ -16,6 +16,7 @@ except ImportError:
     except ImportError:
         ai_service = None
 from app.services.usage_service import usage_service
+from app.services.payment_service import payment_service
 from app.services.git_service import git_service
 from app.middleware.rate_limiter import rate_limit
 from app.security.input_validator import input_validator
@@ -326,14 +327,21 @@ def analyze_code():
                 'available_providers': available_providers
             }), 503
         
-        # Get git diff if available
-        git_diff_data = None
+        # Start the git diff in the background so it overlaps with the AI request
+        git_diff_future = None
         include_git_diff = data.get('include_git_diff', True)  # Default to True
         
         if include_git_diff and git_service.git_available:
+            git_diff_future = git_service.submit_current_diff()
+        
+        # Perform analysis
+        result = ai_service.analyze_code(code, language, explain_level, provider)
+        
+        # Collect the git diff; it is only reported alongside a successful analysis
+        git_diff_data = None
+        if git_diff_future is not None and result['success']:
             try:
-                # Try to get current git diff
-                git_diff_result = git_service.get_current_diff()
+                git_diff_result = git_diff_future.result()
                 if git_diff_result.success and git_diff_result.has_changes:
                     git_diff_data = {
                         'has_changes': True,
@@ -354,9 +362,6 @@ def analyze_code():
                 logger.warning(f"Failed to get git diff: {e}")
                 git_diff_data = {'has_changes': False, 'error': str(e)}
         
-        # Perform analysis
-        result = ai_service.analyze_code(code, language, explain_level, provider)
-        
         if result['success']:
             # Add git diff data to result
             if git_diff_data:
@@ -391,6 +396,7 @@ def get_git_diff():
     Query parameters:
     - file_path: Optional specific file to diff
     - staged: Whether to get staged changes (default: false)
+    - context_lines: Unchanged lines around each change, 0-100 (default: 3)
     
     Returns git diff information with highlighted changes.
     """
@@ -404,9 +410,13 @@ def get_git_diff():
         # Get query parameters
         file_path = request.args.get('file_path')
         staged = request.args.get('staged', 'false').lower() == 'true'
+        summary_only = request.args.get('summary_only', 'false').lower() == 'true'
+        context_lines = min(max(request.args.get('context_lines', 3, type=int), 0), 100)
         
         # Get git diff
-        diff_result = git_service.get_current_diff(file_path=file_path, staged=staged)
+        diff_result = git_service.get_current_diff(file_path=file_path, staged=staged,
+                                                   summary_only=summary_only,
+                                                   context_lines=context_lines)
         
         if diff_result.success:
             return jsonify({
@@ -481,6 +491,76 @@ def get_git_status():
             'error': f'Git status failed: {str(e)}'
         }), 500
 
+@api_bp.route('/git/snapshot', methods=['GET'])
+@rate_limit(requests_per_minute=30, requests_per_hour=200)
+def get_git_snapshot():
+    """
+    Get diff, file status and HEAD commit in one request.
+    
+    Query parameters:
+    - file_path: Optional specific file to diff and report status for
+    - staged: Whether to get staged changes (default: false)
+    
+    The underlying git commands run concurrently, so this is faster than
+    calling /git/diff and /git/status one after the other.
+    """
+    try:
+        if not git_service.git_available:
+            return jsonify({
+                'success': False,
+                'error': 'Git is not available on this system'
+            }), 503
+        
+        if not git_service.is_git_repository():
+            return jsonify({
+                'success': False,
+                'error': 'Not in a git repository'
+            }), 400
+        
+        file_path = request.args.get('file_path')
+        staged = request.args.get('staged', 'false').lower() == 'true'
+        
+        snapshot = git_service.snapshot(file_path=file_path, staged=staged)
+        diff_result = snapshot['diff']
+        if not diff_result.success:
+            return jsonify({
+                'success': False,
+                'error': diff_result.error or 'Failed to get git diff'
+            }), 500
+        
+        file_status = snapshot['status']
+        return jsonify({
+            'success': True,
+            'head': snapshot['head'],
+            'git_diff': {
+                'has_changes': diff_result.has_changes,
+                'added_lines': diff_result.added_lines,
+                'removed_lines': diff_result.removed_lines,
+                'diff_lines': [
+                    {
+                        'line_number': line.line_number,
+                        'content': line.content,
+                        'type': line.type
+                    }
+                    for line in diff_result.diff_lines
+                ]
+            },
+            'git_status': {
+                'is_git_repo': True,
+                'files': file_status,
+                'has_changes': len(file_status) > 0
+            },
+            'file_path': file_path,
+            'staged': staged
+        })
+        
+    except Exception as e:
+        logger.error(f"Unexpected error in get_git_snapshot endpoint: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Git snapshot failed: {str(e)}'
+        }), 500
+
 @api_bp.route('/generate', methods=['POST'])
 @rate_limit(requests_per_minute=10, requests_per_hour=50)
 def generate_code():
@@ -692,6 +772,7 @@ def create_admin_plan():
         
         plan_id = PlanRepository.create_plan(plan_data)
         if plan_id:
+            payment_service.invalidate_plans_cache()
             new_plan = PlanRepository.get_plan_by_id(plan_id)
             return jsonify({'success': True, 'plan': new_plan.to_dict()}), 201
         else:
@@ -711,6 +792,7 @@ def update_admin_plan(plan_id):
         
         success = PlanRepository.update_plan(plan_id, plan_data)
         if success:
+            payment_service.invalidate_plans_cache()
             updated_plan = PlanRepository.get_plan_by_id(plan_id)
             return jsonify({'success': True, 'plan': updated_plan.to_dict()})
         else:
@@ -726,6 +808,7 @@ def toggle_admin_plan_status(plan_id):
     try:
         success = PlanRepository.toggle_plan_status(plan_id)
         if success:
+            payment_service.invalidate_plans_cache()
             return jsonify({'success': True, 'message': f'Plan {plan_id} status toggled.'})
         else:
             return jsonify({'success': False, 'error': 'Failed to toggle plan status'}), 400
@@ -740,6 +823,7 @@ def delete_admin_plan(plan_id):
     try:
         success = PlanRepository.delete_plan(plan_id)
         if success:
+            payment_service.invalidate_plans_cache()
             return jsonify({'success': True, 'message': f'Plan {plan_id} deleted.'})
         else:
             return jsonify({'success': False, 'error': 'Failed to delete plan'}), 400
@@ -2,14 +2,13 @@
 Payment and subscription API routes.
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from datetime import date, datetime
 from decimal import Decimal
 from app.services.auth_service import auth_service
 from app.services.payment_service import payment_service
 from app.models.user import UserRole
 from app.middleware.rate_limiter import rate_limit
-from app.database.plan_repository import PlanRepository
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,36 +21,8 @@ payments_bp = Blueprint('payments', __name__)
 def get_subscription_plans():
     """Get all available subscription plans."""
     try:
-        # Get plans from database
-        plans = PlanRepository.get_all_plans(active_only=True)
-        
-        # Convert to API format
-        plans_data = []
-        for plan in plans:
-            plan_dict = plan.to_dict()
-            # Ensure ID is string for frontend compatibility
-            plan_dict['id'] = str(plan_dict['id'])
-            # Add additional fields for frontend compatibility
-            plan_type = plan_dict.get('plan_type', 'monthly')
-            if plan_type == 'yearly':
-                plan_dict['interval'] = 'year'
-            elif plan_type == 'monthly':
-                plan_dict['interval'] = 'month'
-            else:
-                plan_dict['interval'] = plan_type.replace('ly', '') if 'ly' in plan_type else plan_type
-            
-            plan_dict['price'] = float(plan_dict.get('price_per_unit', 0))
-            plan_dict['executionLimit'] = plan_dict.get('features', {}).get('execution_limit', 100)
-            plan_dict['storageLimit'] = plan_dict.get('features', {}).get('storage_limit', 1024)
-            plan_dict['features'] = plan_dict.get('features', {}).get('features', [])
-            plans_data.append(plan_dict)
-        
-        return jsonify({
-            'success': True,
-            'plans': plans_data,
-            'count': len(plans_data)
-        })
-        
+        # Serialized once per catalog refresh and shared by every request
+        return Response(payment_service.get_plans_payload(), mimetype='application/json')
     except Exception as e:
         logger.error(f"Error getting subscription plans: {str(e)}")
         return jsonify({
@@ -129,7 +100,7 @@ def calculate_subscription_cost():
             }), 400
         
         # Calculate cost
-        success, total_cost, error = payment_service.calculate_subscription_cost(
+        success, total_cost, plan, error = payment_service.calculate_subscription_cost(
             plan_id=plan_id,
             start_date=start_date,
             end_date=end_date,
@@ -144,9 +115,7 @@ def calculate_subscription_cost():
                 calculated_duration = duration_days
             else:
                 # Get plan default duration
-                plans = {plan.id: plan for plan in payment_service.get_available_plans()}
-                plan = plans.get(plan_id)
-                calculated_duration = plan.get_duration_days() if plan else 0
+                calculated_duration = plan.get_duration_days()
             
             return jsonify({
                 'success': True,
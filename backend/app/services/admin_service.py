@@ -4,11 +4,50 @@ Admin service for dashboard statistics and management operations.
 
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
-from app.database.connection import get_db_connection
+from app.database.connection import get_db_connection, get_read_connection
 import logging
 
 logger = logging.getLogger(__name__)
 
+# SQLite date modifiers for the optional look-back window on distribution charts
+ANALYTICS_WINDOWS = {
+    '7d': '-7 days',
+    '30d': '-30 days',
+    '90d': '-90 days',
+    '12m': '-12 months',
+    'all': None
+}
+
+
+def _columns(rows, width: int) -> Tuple[List[Any], ...]:
+    """Transpose fetched rows into per-column lists in a single pass."""
+    if not rows:
+        return tuple([] for _ in range(width))
+    return tuple(list(column) for column in zip(*rows))
+
+
+def _empty_revenue_analytics(period: str) -> Dict[str, Any]:
+    """Build a fresh zeroed analytics payload (callers may mutate the result)."""
+    return {
+        'total_revenue': 0.0,
+        'current_revenue': 0.0,
+        'previous_revenue': 0.0,
+        'revenue_growth': 0.0,
+        'total_users': 0,
+        'paying_users': 0,
+        'conversion_rate': 0.0,
+        'chart_data': {
+            'monthly_revenue': {'labels': [], 'data': [], 'transactions': []},
+            'daily_revenue': {'labels': [], 'data': [], 'transactions': []},
+            'top_plans': [],
+            'payment_methods': [],
+            'subscription_status': [],
+            'user_growth': {'labels': [], 'data': []}
+        },
+        'period': period
+    }
+
+
 class AdminService:
     """Service for admin dashboard operations."""
     
@@ -664,107 +703,140 @@ class AdminService:
             logger.error(f"Error processing refund: {str(e)}")
             return False, f"Failed to process refund: {str(e)}"
     
-    def get_revenue_analytics(self, period: str = 'monthly') -> Dict[str, Any]:
-        """Get comprehensive revenue analytics data with charts."""
+    def get_revenue_analytics(self, period: str = 'monthly', window: str = 'all') -> Dict[str, Any]:
+        """
+        Get comprehensive revenue analytics data with charts.
+        
+        Args:
+            period: Reporting period used for revenue growth
+            window: Look-back window for the payment method and subscription
+                status distributions (one of ANALYTICS_WINDOWS; defaults to all time)
+        """
+        since_modifier = ANALYTICS_WINDOWS.get(window)
+        since_clause = "AND created_at >= date('now', ?)" if since_modifier else ''
+        since_params = (since_modifier,) if since_modifier else ()
+        
         try:
-            with get_db_connection() as conn:
+            with get_read_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Get total revenue
+                # New deployments often have no completed payments yet; skip the
+                # revenue aggregations entirely in that case.
                 cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0) FROM payments 
-                    WHERE status = 'completed'
+                    SELECT EXISTS(SELECT 1 FROM payments WHERE status = 'completed') AS has_payments
                 ''')
-                total_revenue = float(cursor.fetchone()[0])
+                has_payments = cursor.fetchone()['has_payments']
                 
-                # Get revenue growth (compare with previous period)
-                if period == 'monthly':
+                if has_payments:
+                    # Get total, current-month and previous-month revenue in one scan
+                    # (TOTAL() always yields a REAL, even for no rows)
                     cursor.execute('''
-                        SELECT COALESCE(SUM(amount), 0) FROM payments 
+                        SELECT 
+                            TOTAL(amount) AS total_revenue,
+                            TOTAL(amount) FILTER (
+                                WHERE strftime('%Y-%m', created_at) = strftime('%Y-%m', 'now')
+                            ) AS current_revenue,
+                            TOTAL(amount) FILTER (
+                                WHERE strftime('%Y-%m', created_at) = strftime('%Y-%m', 'now', '-1 month')
+                            ) AS previous_revenue
+                        FROM payments 
+                        WHERE status = 'completed'
+                    ''')
+                    revenue_row = cursor.fetchone()
+                    total_revenue = revenue_row['total_revenue']
+                    
+                    # Get revenue growth (compare with previous period)
+                    if period == 'monthly':
+                        previous_revenue = revenue_row['previous_revenue']
+                        current_revenue = revenue_row['current_revenue']
+                    else:
+                        previous_revenue = 0
+                        current_revenue = total_revenue
+                    
+                    # Calculate growth percentage
+                    revenue_growth = 0
+                    if previous_revenue > 0:
+                        revenue_growth = ((current_revenue - previous_revenue) / previous_revenue) * 100
+                    
+                    # Get monthly revenue trend for chart (last 12 months)
+                    cursor.execute('''
+                        SELECT 
+                            strftime('%Y-%m', created_at) as month,
+                            TOTAL(amount) as revenue,
+                            COUNT(*) as transactions
+                        FROM payments 
                         WHERE status = 'completed' 
-                        AND strftime('%Y-%m', created_at) = strftime('%Y-%m', 'now', '-1 month')
+                        AND created_at >= date('now', '-12 months')
+                        GROUP BY strftime('%Y-%m', created_at)
+                        ORDER BY month ASC
                     ''')
-                    previous_revenue = float(cursor.fetchone()[0])
+                    monthly_data = cursor.fetchall()
                     
+                    # Get daily revenue for current month
                     cursor.execute('''
-                        SELECT COALESCE(SUM(amount), 0) FROM payments 
+                        SELECT 
+                            strftime('%Y-%m-%d', created_at) as day,
+                            TOTAL(amount) as revenue,
+                            COUNT(*) as transactions
+                        FROM payments 
                         WHERE status = 'completed' 
                         AND strftime('%Y-%m', created_at) = strftime('%Y-%m', 'now')
+                        GROUP BY strftime('%Y-%m-%d', created_at)
+                        ORDER BY day ASC
                     ''')
-                    current_revenue = float(cursor.fetchone()[0])
+                    daily_data = cursor.fetchall()
+                    
+                    # Get payment method distribution
+                    cursor.execute(f'''
+                        SELECT 
+                            payment_gateway,
+                            COUNT(*) as count,
+                            TOTAL(amount) as revenue,
+                            100.0 * COUNT(*) / SUM(COUNT(*)) OVER () as percentage
+                        FROM payments 
+                        WHERE status = 'completed' {since_clause}
+                        GROUP BY payment_gateway
+                        ORDER BY revenue DESC
+                    ''', since_params)
+                    payment_methods = cursor.fetchall()
                 else:
-                    previous_revenue = 0
-                    current_revenue = total_revenue
-                
-                # Calculate growth percentage
-                revenue_growth = 0
-                if previous_revenue > 0:
-                    revenue_growth = ((current_revenue - previous_revenue) / previous_revenue) * 100
-                
-                # Get monthly revenue trend for chart (last 12 months)
-                cursor.execute('''
-                    SELECT 
-                        strftime('%Y-%m', created_at) as month,
-                        COALESCE(SUM(amount), 0) as revenue,
-                        COUNT(*) as transactions
-                    FROM payments 
-                    WHERE status = 'completed' 
-                    AND created_at >= date('now', '-12 months')
-                    GROUP BY strftime('%Y-%m', created_at)
-                    ORDER BY month ASC
-                ''')
-                monthly_data = cursor.fetchall()
+                    total_revenue = previous_revenue = current_revenue = 0.0
+                    revenue_growth = 0
+                    monthly_data = daily_data = payment_methods = []
                 
-                # Get daily revenue for current month
+                # Get top plans by revenue (payments are pre-aggregated per
+                # subscription so the join fans out over one row per subscription)
                 cursor.execute('''
-                    SELECT 
-                        strftime('%Y-%m-%d', created_at) as day,
-                        COALESCE(SUM(amount), 0) as revenue,
-                        COUNT(*) as transactions
-                    FROM payments 
-                    WHERE status = 'completed' 
-                    AND strftime('%Y-%m', created_at) = strftime('%Y-%m', 'now')
-                    GROUP BY strftime('%Y-%m-%d', created_at)
-                    ORDER BY day ASC
-                ''')
-                daily_data = cursor.fetchall()
-                
-                # Get top plans by revenue
-                cursor.execute('''
-                    SELECT sp.name, COALESCE(SUM(p.amount), 0) as revenue,
-                           COUNT(p.id) as transactions,
-                           COUNT(DISTINCT us.user_id) as unique_subscribers
+                    WITH pay AS (
+                        SELECT subscription_id, TOTAL(amount) as revenue, COUNT(*) as transactions
+                        FROM payments
+                        WHERE status = 'completed'
+                        GROUP BY subscription_id
+                    )
+                    SELECT sp.name, TOTAL(pay.revenue) as revenue,
+                           COALESCE(SUM(pay.transactions), 0) as transactions,
+                           COUNT(DISTINCT us.user_id) as unique_subscribers,
+                           COALESCE(100.0 * TOTAL(pay.revenue) / NULLIF(?, 0), 0) as percentage
                     FROM subscription_plans sp
                     LEFT JOIN user_subscriptions us ON sp.id = us.plan_id
-                    LEFT JOIN payments p ON us.id = p.subscription_id AND p.status = 'completed'
+                    LEFT JOIN pay ON us.id = pay.subscription_id
                     WHERE sp.is_active = 1
                     GROUP BY sp.id, sp.name
                     ORDER BY revenue DESC
                     LIMIT 10
-                ''')
+                ''', (total_revenue,))
                 top_plans_data = cursor.fetchall()
                 
-                # Get payment method distribution
-                cursor.execute('''
-                    SELECT 
-                        payment_gateway,
-                        COUNT(*) as count,
-                        COALESCE(SUM(amount), 0) as revenue
-                    FROM payments 
-                    WHERE status = 'completed'
-                    GROUP BY payment_gateway
-                    ORDER BY revenue DESC
-                ''')
-                payment_methods = cursor.fetchall()
-                
                 # Get subscription status distribution
-                cursor.execute('''
+                cursor.execute(f'''
                     SELECT 
                         status,
-                        COUNT(*) as count
+                        COUNT(*) as count,
+                        100.0 * COUNT(*) / SUM(COUNT(*)) OVER () as percentage
                     FROM user_subscriptions
+                    WHERE 1 = 1 {since_clause}
                     GROUP BY status
-                ''')
+                ''', since_params)
                 subscription_status = cursor.fetchall()
                 
                 # Get user growth data
@@ -780,56 +852,60 @@ class AdminService:
                 user_growth = cursor.fetchall()
                 
                 # Calculate conversion rates
-                cursor.execute('SELECT COUNT(*) FROM users')
-                total_users = cursor.fetchone()[0]
+                cursor.execute('SELECT COUNT(*) AS total_users FROM users')
+                total_users = cursor.fetchone()['total_users']
                 
-                cursor.execute('SELECT COUNT(DISTINCT user_id) FROM user_subscriptions WHERE status = "active"')
-                paying_users = cursor.fetchone()[0]
+                cursor.execute('SELECT COUNT(DISTINCT user_id) AS paying_users FROM user_subscriptions WHERE status = "active"')
+                paying_users = cursor.fetchone()['paying_users']
                 
                 conversion_rate = (paying_users / total_users * 100) if total_users > 0 else 0
                 
                 # Format data for charts
+                monthly_labels, monthly_values, monthly_transactions = _columns(monthly_data, 3)
+                daily_labels, daily_values, daily_transactions = _columns(daily_data, 3)
+                growth_labels, growth_values = _columns(user_growth, 2)
+                
                 chart_data = {
                     'monthly_revenue': {
-                        'labels': [row[0] for row in monthly_data],
-                        'data': [float(row[1]) for row in monthly_data],
-                        'transactions': [row[2] for row in monthly_data]
+                        'labels': monthly_labels,
+                        'data': monthly_values,
+                        'transactions': monthly_transactions
                     },
                     'daily_revenue': {
-                        'labels': [row[0] for row in daily_data],
-                        'data': [float(row[1]) for row in daily_data],
-                        'transactions': [row[2] for row in daily_data]
+                        'labels': daily_labels,
+                        'data': daily_values,
+                        'transactions': daily_transactions
                     },
                     'top_plans': [
                         {
-                            'name': row[0],
-                            'revenue': float(row[1]),
-                            'transactions': row[2],
-                            'subscribers': row[3],
-                            'percentage': (float(row[1]) / total_revenue * 100) if total_revenue > 0 else 0
+                            'name': row['name'],
+                            'revenue': row['revenue'],
+                            'transactions': row['transactions'],
+                            'subscribers': row['unique_subscribers'],
+                            'percentage': row['percentage']
                         }
                         for row in top_plans_data
                     ],
                     'payment_methods': [
                         {
-                            'method': row[0],
-                            'count': row[1],
-                            'revenue': float(row[2]),
-                            'percentage': (row[1] / sum([r[1] for r in payment_methods]) * 100) if payment_methods else 0
+                            'method': row['payment_gateway'],
+                            'count': row['count'],
+                            'revenue': row['revenue'],
+                            'percentage': row['percentage']
                         }
                         for row in payment_methods
                     ],
                     'subscription_status': [
                         {
-                            'status': row[0],
-                            'count': row[1],
-                            'percentage': (row[1] / sum([r[1] for r in subscription_status]) * 100) if subscription_status else 0
+                            'status': row['status'],
+                            'count': row['count'],
+                            'percentage': row['percentage']
                         }
                         for row in subscription_status
                     ],
                     'user_growth': {
-                        'labels': [row[0] for row in user_growth],
-                        'data': [row[1] for row in user_growth]
+                        'labels': growth_labels,
+                        'data': growth_values
                     }
                 }
                 
@@ -847,24 +923,7 @@ class AdminService:
                 
         except Exception as e:
             logger.error(f"Error getting revenue analytics: {str(e)}")
-            return {
-                'total_revenue': 0.0,
-                'current_revenue': 0.0,
-                'previous_revenue': 0.0,
-                'revenue_growth': 0.0,
-                'total_users': 0,
-                'paying_users': 0,
-                'conversion_rate': 0.0,
-                'chart_data': {
-                    'monthly_revenue': {'labels': [], 'data': [], 'transactions': []},
-                    'daily_revenue': {'labels': [], 'data': [], 'transactions': []},
-                    'top_plans': [],
-                    'payment_methods': [],
-                    'subscription_status': [],
-                    'user_growth': {'labels': [], 'data': []}
-                },
-                'period': period
-            }
+            return _empty_revenue_analytics(period)
 
     def update_user(self, user_id: int, user_data: Dict[str, Any]) -> Tuple[bool, str]:
         """Update user information."""
@@ -10,6 +10,8 @@ from .together_service import together_service
 
 logger = logging.getLogger(__name__)
 
+NO_PROVIDERS_ERROR = 'No AI providers are configured. Please set up at least one API key.'
+
 class AIService:
     def __init__(self):
         self.providers = {
@@ -18,6 +20,17 @@ class AIService:
             'together': together_service
         }
         self.default_provider = 'openai'
+        # Reverse lookup used to report which provider served a request
+        self._service_to_name = {id(service): provider for provider, service in self.providers.items()}
+        self.refresh_configured_providers()
+    
+    def refresh_configured_providers(self) -> None:
+        """Re-read provider configuration (API keys are only loaded at startup)."""
+        self._configured_list = [
+            provider for provider, service in self.providers.items() 
+            if service.is_configured()
+        ]
+        self._available_str = ", ".join(self._configured_list)
     
     def get_available_providers(self) -> Dict[str, bool]:
         """Get list of available AI providers and their configuration status."""
@@ -28,23 +41,19 @@ class AIService:
     
     def get_configured_providers(self) -> list:
         """Get list of configured AI providers."""
-        return [
-            provider for provider, service in self.providers.items() 
-            if service.is_configured()
-        ]
+        return list(self._configured_list)
     
     def is_any_provider_configured(self) -> bool:
         """Check if any AI provider is configured."""
-        return any(service.is_configured() for service in self.providers.values())
+        return bool(self._configured_list)
     
     def get_service(self, provider: Optional[str] = None):
         """Get AI service for the specified provider."""
         if provider is None:
             # Try to find the first configured provider
-            configured_providers = self.get_configured_providers()
-            if not configured_providers:
+            if not self._configured_list:
                 return None
-            provider = configured_providers[0]
+            provider = self._configured_list[0]
         
         if provider not in self.providers:
             logger.warning(f"Unknown AI provider: {provider}")
@@ -73,17 +82,7 @@ class AIService:
         """
         service = self.get_service(provider)
         if service is None:
-            available_providers = self.get_configured_providers()
-            if not available_providers:
-                return {
-                    'success': False,
-                    'error': 'No AI providers are configured. Please set up at least one API key.'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Provider "{provider}" not available. Available providers: {", ".join(available_providers)}'
-                }
+            return self._unavailable_provider_error(provider)
         
         try:
             result = service.analyze_code(code, language, explain_level)
@@ -114,17 +113,7 @@ class AIService:
         """
         service = self.get_service(provider)
         if service is None:
-            available_providers = self.get_configured_providers()
-            if not available_providers:
-                return {
-                    'success': False,
-                    'error': 'No AI providers are configured. Please set up at least one API key.'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Provider "{provider}" not available. Available providers: {", ".join(available_providers)}'
-                }
+            return self._unavailable_provider_error(provider)
         
         try:
             result = service.generate_code(prompt, language, explain_level)
@@ -139,12 +128,18 @@ class AIService:
                 'error': f'Code generation failed with provider {provider}: {str(e)}'
             }
     
+    def _unavailable_provider_error(self, provider: Optional[str]) -> Dict:
+        """Build the error result returned when no usable provider is found."""
+        if not self._configured_list:
+            return {'success': False, 'error': NO_PROVIDERS_ERROR}
+        return {
+            'success': False,
+            'error': f'Provider "{provider}" not available. Available providers: {self._available_str}'
+        }
+    
     def _get_provider_name(self, service) -> str:
         """Get provider name from service instance."""
-        for provider, provider_service in self.providers.items():
-            if provider_service is service:
-                return provider
-        return 'unknown'
+        return self._service_to_name.get(id(service), 'unknown')
 
 # Global service instance
 ai_service = AIService()
\ No newline at end of file
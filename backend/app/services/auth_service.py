@@ -4,31 +4,117 @@ Authentication service for user management and JWT token handling.
 
 import jwt
 import secrets
+import functools
+import os
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, Dict, Any
 from flask import current_app, request, session
 from app.models.user import User, UserSession, UserRole, PasswordResetToken, EmailVerificationToken
+from app.database.connection import get_thread_connection
 import logging
 
 logger = logging.getLogger(__name__)
 
+# SQL for the login path, kept as constants so the per-thread connection's
+# statement cache reuses the parsed statements
+_AUTH_SELECT_SQL = (
+    'SELECT id, email, password_hash, first_name, last_name, role, is_active, email_verified '
+    'FROM users WHERE email = ?'
+)
+_LAST_LOGIN_UPDATE_SQL = (
+    'UPDATE users SET last_login = CURRENT_TIMESTAMP, '
+    'password_hash = COALESCE(?, password_hash) WHERE id = ?'
+)
+
+# Role hierarchy keyed by the role names carried in token payloads
+ROLE_LEVELS_BY_NAME = {role.value: role.level for role in UserRole}
+
+# Upper bound on bearer token size; ours are a few hundred bytes
+MAX_TOKEN_LENGTH = 4096
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class _OrjsonJWT(jwt.PyJWT):
+    """PyJWT with orjson-backed claim (de)serialization."""
+    
+    def _encode_payload(self, payload, headers=None, json_encoder=None):
+        if json_encoder is not None:
+            return super()._encode_payload(payload, headers=headers, json_encoder=json_encoder)
+        return orjson.dumps(payload)
+    
+    def _decode_payload(self, decoded):
+        try:
+            payload = orjson.loads(decoded['payload'])
+        except orjson.JSONDecodeError as e:
+            raise jwt.DecodeError(f"Invalid payload string: {e}")
+        if not isinstance(payload, dict):
+            raise jwt.DecodeError("Invalid payload string: must be a json object")
+        return payload
+
+
 class AuthService:
     """Service for handling authentication operations."""
     
     def __init__(self):
         self.jwt_secret = None
         self.jwt_algorithm = 'HS256'
+        self._jwt = _OrjsonJWT() if orjson is not None else jwt.PyJWT()
+        self._jwt_key = None
+        self._jwt_algorithms = [self.jwt_algorithm]
+        self._jwt_decode_options = {'require': ['exp', 'type']}
         self.access_token_expires = timedelta(hours=1)
         self.refresh_token_expires = timedelta(days=7)
+        self._access_exp_secs = int(self.access_token_expires.total_seconds())
+        self._refresh_exp_secs = int(self.refresh_token_expires.total_seconds())
         # Simple in-memory user store for testing (replace with database in production)
         self.users = {}
+        self.users_by_id = {}
         self.user_id_counter = 1
+        self._dummy_password_hash = None
+        # Short-lived cache of successful password checks:
+        # (email, sha256(password)) -> (password_hash, verified_at)
+        self._auth_cache = OrderedDict()
+        self._auth_cache_ttl = 60
+        self._auth_cache_maxsize = 1024
+        self._auth_cache_lock = threading.Lock()
+        # Decoded payloads of recently verified tokens: sha256(token) -> payload
+        self._token_cache = OrderedDict()
+        self._token_cache_maxsize = 4096
+        self._token_cache_lock = threading.Lock()
+        # Password hashing releases the GIL; cap concurrent hashes at the core
+        # count so a login flood cannot starve every other request of CPU
+        self._hash_slots = threading.BoundedSemaphore(os.cpu_count() or 1)
+        self._hash_slot_timeout = 10
+        # Refresh token IDs are drawn from one urandom read per 1024 tokens
+        self._jti_buffer = deque()
+        self._jti_lock = threading.Lock()
+        self._jti_batch_size = 1024
     
     def initialize(self, app):
         """Initialize the auth service with Flask app configuration."""
         self.jwt_secret = app.config.get('JWT_SECRET_KEY', app.config.get('SECRET_KEY'))
         if not self.jwt_secret:
             raise ValueError("JWT_SECRET_KEY or SECRET_KEY must be configured")
+        with self._token_cache_lock:
+            self._token_cache.clear()
+        
+        # Encode the signing key once so PyJWT's key preparation is a no-op per call
+        self._jwt_key = self.jwt_secret.encode('utf-8') if isinstance(self.jwt_secret, str) else self.jwt_secret
+        
+        # Hash of a random password, verified against when the email is unknown so
+        # that "no such user" takes as long as "wrong password"
+        self._dummy_password_hash = User.hash_password(secrets.token_urlsafe(16))
     
     def register_user(self, email: str, password: str, first_name: str, 
                      last_name: str, role: UserRole = UserRole.STUDENT) -> Tuple[bool, str, Optional[User]]:
@@ -63,6 +149,7 @@ class AuthService:
             user.id = self.user_id_counter
             self.user_id_counter += 1
             self.users[email] = user
+            self.users_by_id[user.id] = user
             
             logger.info(f"User registered successfully: {email}")
             
@@ -84,18 +171,15 @@ class AuthService:
                 return False, "Email and password are required", None
             
             # Fetch user from database
-            from app.database.connection import get_db_connection
-            import bcrypt
-            
-            with get_db_connection() as conn:
+            with get_thread_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    'SELECT id, email, password_hash, first_name, last_name, role, is_active, email_verified FROM users WHERE email = ?',
-                    (email,)
-                )
+                cursor.execute(_AUTH_SELECT_SQL, (email,))
                 user_row = cursor.fetchone()
                 
                 if not user_row:
+                    if self._dummy_password_hash:
+                        with self._hash_slot():
+                            User.verify_password_hash(password, self._dummy_password_hash)
                     return False, "Invalid email or password", None
                 
                 # Check if account is active
@@ -103,7 +187,7 @@ class AuthService:
                     return False, "Account is deactivated", None
                 
                 # Verify password
-                if not bcrypt.checkpw(password.encode('utf-8'), user_row['password_hash'].encode('utf-8')):
+                if not self._check_password(email, password, user_row['password_hash']):
                     return False, "Invalid email or password", None
                 
                 # Create user object
@@ -117,11 +201,14 @@ class AuthService:
                     email_verified=bool(user_row['email_verified'])
                 )
                 
-                # Update last login
-                cursor.execute(
-                    'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?',
-                    (user.id,)
-                )
+                # Update last login, transparently upgrading legacy bcrypt hashes
+                # in the same statement (the row is only written after the
+                # password is verified, so no write lock is held during hashing)
+                new_hash = None
+                if User.password_needs_rehash(user_row['password_hash']):
+                    with self._hash_slot():
+                        new_hash = User.hash_password(password)
+                cursor.execute(_LAST_LOGIN_UPDATE_SQL, (new_hash, user.id))
                 conn.commit()
                 
                 logger.info(f"User authenticated successfully: {email}")
@@ -131,6 +218,47 @@ class AuthService:
             logger.error(f"Error authenticating user: {str(e)}")
             return False, f"Authentication failed: {str(e)}", None
     
+    @contextmanager
+    def _hash_slot(self):
+        """Hold one of the bounded password-hashing slots."""
+        if not self._hash_slots.acquire(timeout=self._hash_slot_timeout):
+            raise RuntimeError("Too many concurrent login attempts, please retry")
+        try:
+            yield
+        finally:
+            self._hash_slots.release()
+    
+    def _check_password(self, email: str, password: str, password_hash: str) -> bool:
+        """
+        Verify a password against its stored hash, reusing a recent successful check.
+        
+        Only successful verifications are cached, and a hit requires the stored
+        hash to be unchanged, so password changes invalidate the entry.
+        """
+        password_bytes = password.encode('utf-8')
+        key = (email, hashlib.sha256(password_bytes).digest())
+        now = time.monotonic()
+        
+        with self._auth_cache_lock:
+            cached = self._auth_cache.get(key)
+            if cached is not None:
+                cached_hash, verified_at = cached
+                if now - verified_at < self._auth_cache_ttl and hmac.compare_digest(cached_hash, password_hash):
+                    return True
+                del self._auth_cache[key]
+        
+        with self._hash_slot():
+            if not User.verify_password_hash(password_bytes, password_hash):
+                return False
+        
+        with self._auth_cache_lock:
+            self._auth_cache[key] = (password_hash, now)
+            self._auth_cache.move_to_end(key)
+            while len(self._auth_cache) > self._auth_cache_maxsize:
+                self._auth_cache.popitem(last=False)
+        
+        return True
+    
     def generate_tokens(self, user: User) -> Dict[str, str]:
         """
         Generate JWT access and refresh tokens for a user.
@@ -139,7 +267,8 @@ class AuthService:
             Dictionary with access_token and refresh_token
         """
         try:
-            now = datetime.utcnow()
+            # Integer timestamps skip PyJWT's datetime -> timestamp conversion
+            now = int(time.time())
             
             # Access token payload
             access_payload = {
@@ -147,7 +276,7 @@ class AuthService:
                 'email': user.email,
                 'role': user.role.value if isinstance(user.role, UserRole) else user.role,
                 'iat': now,
-                'exp': now + self.access_token_expires,
+                'exp': now + self._access_exp_secs,
                 'type': 'access'
             }
             
@@ -155,25 +284,46 @@ class AuthService:
             refresh_payload = {
                 'user_id': user.id,
                 'iat': now,
-                'exp': now + self.refresh_token_expires,
+                'exp': now + self._refresh_exp_secs,
                 'type': 'refresh',
-                'jti': secrets.token_urlsafe(16)  # Unique token ID
+                'jti': self._next_jti()  # Unique token ID
             }
             
-            access_token = jwt.encode(access_payload, self.jwt_secret, algorithm=self.jwt_algorithm)
-            refresh_token = jwt.encode(refresh_payload, self.jwt_secret, algorithm=self.jwt_algorithm)
+            access_token = self._jwt.encode(access_payload, self._jwt_key, algorithm=self.jwt_algorithm)
+            refresh_token = self._jwt.encode(refresh_payload, self._jwt_key, algorithm=self.jwt_algorithm)
             
             return {
                 'access_token': access_token,
                 'refresh_token': refresh_token,
                 'token_type': 'Bearer',
-                'expires_in': int(self.access_token_expires.total_seconds())
+                'expires_in': self._access_exp_secs
             }
             
         except Exception as e:
             logger.error(f"Error generating tokens: {str(e)}")
             raise
     
+    def _next_jti(self) -> str:
+        """Return a unique 128-bit token ID, refilling the buffer in batches."""
+        try:
+            return self._jti_buffer.popleft()
+        except IndexError:
+            pass
+        
+        if not self._jti_lock.acquire(blocking=False):
+            # Another thread is refilling; don't wait for it
+            return secrets.token_urlsafe(16)
+        try:
+            if not self._jti_buffer:
+                random_bytes = os.urandom(16 * self._jti_batch_size)
+                self._jti_buffer.extend(
+                    base64.urlsafe_b64encode(random_bytes[i:i + 16]).rstrip(b'=').decode('ascii')
+                    for i in range(0, len(random_bytes), 16)
+                )
+            return self._jti_buffer.popleft()
+        finally:
+            self._jti_lock.release()
+    
     def verify_token(self, token: str, token_type: str = 'access') -> Tuple[bool, Optional[Dict[str, Any]], str]:
         """
         Verify and decode a JWT token.
@@ -182,17 +332,33 @@ class AuthService:
             Tuple of (is_valid, payload, error_message)
         """
         try:
-            payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
+            cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+            with self._token_cache_lock:
+                payload = self._token_cache.get(cache_key)
+                if payload is not None:
+                    if time.time() < payload['exp'] - 5:
+                        self._token_cache.move_to_end(cache_key)
+                    else:
+                        del self._token_cache[cache_key]
+                        payload = None
+            
+            if payload is None:
+                # PyJWT validates 'exp' (raising ExpiredSignatureError) and enforces required claims
+                payload = self._jwt.decode(
+                    token, self._jwt_key, algorithms=self._jwt_algorithms,
+                    options=self._jwt_decode_options
+                )
+                with self._token_cache_lock:
+                    self._token_cache[cache_key] = payload
+                    while len(self._token_cache) > self._token_cache_maxsize:
+                        self._token_cache.popitem(last=False)
             
             # Check token type
-            if payload.get('type') != token_type:
+            if not hmac.compare_digest(str(payload.get('type', '')).encode('utf-8'), token_type.encode('utf-8')):
                 return False, None, f"Invalid token type. Expected {token_type}"
             
-            # Check expiration
-            if datetime.utcnow() > datetime.fromtimestamp(payload['exp']):
-                return False, None, "Token has expired"
-            
-            return True, payload, ""
+            # Hand out a copy so callers cannot mutate the cached payload
+            return True, dict(payload), ""
             
         except jwt.ExpiredSignatureError:
             return False, None, "Token has expired"
@@ -202,6 +368,12 @@ class AuthService:
             logger.error(f"Error verifying token: {str(e)}")
             return False, None, f"Token verification failed: {str(e)}"
     
+    def _forget_token(self, token: str) -> None:
+        """Drop a token from the verification cache."""
+        cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self._token_cache_lock:
+            self._token_cache.pop(cache_key, None)
+    
     def refresh_access_token(self, refresh_token: str) -> Tuple[bool, Optional[Dict[str, str]], str]:
         """
         Generate a new access token using a refresh token.
@@ -214,14 +386,10 @@ class AuthService:
             is_valid, payload, error = self.verify_token(refresh_token, 'refresh')
             if not is_valid:
                 return False, None, error
+            self._forget_token(refresh_token)
             
             # Find user by ID in in-memory store
-            user_id = payload['user_id']
-            user = None
-            for stored_user in self.users.values():
-                if stored_user.id == user_id:
-                    user = stored_user
-                    break
+            user = self.users_by_id.get(payload['user_id'])
             
             if not user or not user.is_active:
                 return False, None, "User not found or inactive"
@@ -380,42 +548,56 @@ class AuthService:
             required_role: Minimum role required (optional)
         """
         def decorator(f):
-            def wrapper(*args, **kwargs):
-                # Get token from Authorization header
-                auth_header = request.headers.get('Authorization')
-                if not auth_header or not auth_header.startswith('Bearer '):
-                    return {'error': 'Authentication required'}, 401
-                
-                token = auth_header.split(' ')[1]
-                is_valid, payload, error = self.verify_token(token)
-                
-                if not is_valid:
-                    return {'error': error}, 401
+            # Pick the wrapper once at decoration time so unrestricted routes
+            # carry no role check at all
+            if required_role is None:
+                @functools.wraps(f)
+                def wrapper(*args, **kwargs):
+                    payload, error_response = self._authenticate_request()
+                    if error_response:
+                        return error_response
+                    
+                    # Add user info to request context
+                    request.current_user = payload
+                    
+                    return f(*args, **kwargs)
+            else:
+                required_level = required_role.level
                 
-                # Check role if required
-                if required_role:
-                    user_role = UserRole(payload.get('role', 'student'))
-                    if not self._has_required_role(user_role, required_role):
+                @functools.wraps(f)
+                def wrapper(*args, **kwargs):
+                    payload, error_response = self._authenticate_request()
+                    if error_response:
+                        return error_response
+                    
+                    # Check role
+                    if ROLE_LEVELS_BY_NAME.get(payload.get('role', 'student'), 0) < required_level:
                         return {'error': 'Insufficient permissions'}, 403
-                
-                # Add user info to request context
-                request.current_user = payload
-                
-                return f(*args, **kwargs)
+                    
+                    # Add user info to request context
+                    request.current_user = payload
+                    
+                    return f(*args, **kwargs)
             
-            wrapper.__name__ = f.__name__
             return wrapper
         return decorator
     
-    def _has_required_role(self, user_role: UserRole, required_role: UserRole) -> bool:
-        """Check if user role meets the required role."""
-        role_hierarchy = {
-            UserRole.STUDENT: 1,
-            UserRole.EDITOR: 2,
-            UserRole.ADMIN: 3
-        }
+    def _authenticate_request(self) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[Dict[str, str], int]]]:
+        """Verify the request's bearer token, returning (payload, error_response)."""
+        # Get token from Authorization header
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return None, ({'error': 'Authentication required'}, 401)
+        
+        token = auth_header[7:].strip()
+        if len(token) > MAX_TOKEN_LENGTH:
+            return None, ({'error': 'Invalid token'}, 401)
+        
+        is_valid, payload, error = self.verify_token(token)
+        if not is_valid:
+            return None, ({'error': error}, 401)
         
-        return role_hierarchy.get(user_role, 0) >= role_hierarchy.get(required_role, 0)
+        return payload, None
 
 # Global auth service instance
 auth_service = AuthService()
\ No newline at end of file
@@ -5,32 +5,62 @@ Enhanced AI service with API key rotation, error handling, and multi-model failo
 import os
 import logging
 import time
-import json
+import hashlib
+import itertools
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from threading import Lock
+from threading import Event, Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import random
+from cachetools import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Sequential ids for APIKey; keys load in a fixed order, so ids are stable across restarts
+_api_key_ids = itertools.count(1)
+
+RATE_LIMIT_COOLDOWN_SECONDS = 300.0
+FAILED_KEY_COOLDOWN_SECONDS = 600.0
+# Shared error shapes; per-call fields are layered on with a shallow copy
+_PROVIDER_ERROR = {'success': False}
+_NO_PROVIDERS_ERROR = {
+    'success': False,
+    'error': 'No AI providers available. Please check API key configuration.'
+}
+
+def _provider_error(provider: str, error: str) -> Dict:
+    """Build a failed provider result."""
+    return {**_PROVIDER_ERROR, 'error': error, 'provider': provider}
+
+# How long a provider may run before the next one is tried in parallel
+HEDGE_DELAY_SECONDS = 2.0
+
+# (provider, environment variable) pairs; NAME_1..NAME_5 hold extra keys for rotation
+API_KEY_ENV_VARS = (
+    ('openai', 'OPENAI_API_KEY'),
+    ('gemini', 'GEMINI_API_KEY'),
+    ('together', 'TOGETHER_API_KEY'),
+)
+
 @dataclass
 class APIKey:
     """Represents an API key with its status and usage tracking."""
-    key: str
+    key: str = field(repr=False)
     provider: str
     is_active: bool = True
     failure_count: int = 0
-    last_failure: Optional[datetime] = None
-    last_success: Optional[datetime] = None
-    rate_limit_reset: Optional[datetime] = None
+    # Timestamps are time.monotonic() seconds
+    last_failure: Optional[float] = None
+    last_success: Optional[float] = None
+    rate_limit_reset: Optional[float] = None
     total_requests: int = 0
     successful_requests: int = 0
+    key_id: int = field(default_factory=lambda: next(_api_key_ids))
     
     def mark_failure(self, error_type: str = "unknown"):
         """Mark this key as failed and increment failure count."""
         self.failure_count += 1
-        self.last_failure = datetime.now()
+        self.last_failure = time.monotonic()
         
         # Temporarily disable key if too many failures
         if self.failure_count >= 3:
@@ -40,21 +70,22 @@ class APIKey:
     def mark_success(self):
         """Mark this key as successful and reset failure count."""
         self.failure_count = 0
-        self.last_success = datetime.now()
+        self.last_success = time.monotonic()
         self.successful_requests += 1
         self.total_requests += 1
     
-    def mark_rate_limited(self, reset_time: Optional[datetime] = None):
-        """Mark this key as rate limited."""
-        self.rate_limit_reset = reset_time or datetime.now() + timedelta(minutes=5)
+    def mark_rate_limited(self, reset_time: Optional[float] = None):
+        """Mark this key as rate limited until the given monotonic time (default: 5 minutes)."""
+        now = time.monotonic()
+        self.rate_limit_reset = reset_time or now + RATE_LIMIT_COOLDOWN_SECONDS
         self.is_active = False
-        logger.warning(f"API key for {self.provider} rate limited until {self.rate_limit_reset}")
+        logger.warning(f"API key for {self.provider} rate limited for {self.rate_limit_reset - now:.0f}s")
     
-    def can_use(self) -> bool:
-        """Check if this key can be used."""
+    def can_use(self, now: float) -> bool:
+        """Check if this key can be used at monotonic time ``now``."""
         if not self.is_active:
             # Check if rate limit has expired
-            if self.rate_limit_reset and datetime.now() > self.rate_limit_reset:
+            if self.rate_limit_reset and now > self.rate_limit_reset:
                 self.is_active = True
                 self.rate_limit_reset = None
                 logger.info(f"API key for {self.provider} reactivated after rate limit")
@@ -78,12 +109,15 @@ class EnhancedAIService:
     """Enhanced AI service with key rotation, error handling, and failover."""
     
     def __init__(self):
-        self.api_keys: Dict[str, List[APIKey]] = {}
+        # Copy-on-write: writers publish a new dict under self.lock, readers use it lock-free
+        self.api_keys: Dict[str, Tuple[APIKey, ...]] = {}
         self.provider_configs: Dict[str, ProviderConfig] = {}
         self.providers: Dict[str, Any] = {}
         self.lock = Lock()
-        self.cache: Dict[str, Tuple[Dict, datetime]] = {}
-        self.cache_ttl = timedelta(minutes=5)
+        self.cache_ttl_s = 300.0
+        # Bounded LRU with per-entry expiry; TTLCache is not thread-safe on its own
+        self.cache: TTLCache = TTLCache(maxsize=1024, ttl=self.cache_ttl_s, timer=time.monotonic)
+        self.cache_lock = Lock()
         
         self._initialize_providers()
         self._load_api_keys()
@@ -113,6 +147,10 @@ class EnhancedAIService:
                 models=['meta-llama/Llama-3-8b-chat-hf', 'mistralai/Mixtral-8x7B-Instruct-v0.1']
             )
         }
+        # Failover order by priority; is_enabled is still checked per call since admins toggle it at runtime
+        self._priority_sorted: List[Tuple[str, ProviderConfig]] = sorted(
+            self.provider_configs.items(), key=lambda item: item[1].priority
+        )
         
         # Import and initialize provider services
         try:
@@ -130,170 +168,142 @@ class EnhancedAIService:
     
     def _load_api_keys(self):
         """Load API keys from environment variables."""
-        # Load OpenAI keys
-        openai_keys = []
-        if os.getenv('OPENAI_API_KEY'):
-            openai_keys.append(APIKey(os.getenv('OPENAI_API_KEY'), 'openai'))
-        
-        # Support multiple OpenAI keys
-        for i in range(1, 6):  # Support up to 5 keys per provider
-            key = os.getenv(f'OPENAI_API_KEY_{i}')
-            if key:
-                openai_keys.append(APIKey(key, 'openai'))
+        api_keys: Dict[str, Tuple[APIKey, ...]] = {}
         
-        if openai_keys:
-            self.api_keys['openai'] = openai_keys
-        
-        # Load Gemini keys
-        gemini_keys = []
-        if os.getenv('GEMINI_API_KEY'):
-            gemini_keys.append(APIKey(os.getenv('GEMINI_API_KEY'), 'gemini'))
-        
-        for i in range(1, 6):
-            key = os.getenv(f'GEMINI_API_KEY_{i}')
-            if key:
-                gemini_keys.append(APIKey(key, 'gemini'))
-        
-        if gemini_keys:
-            self.api_keys['gemini'] = gemini_keys
-        
-        # Load Together AI keys
-        together_keys = []
-        if os.getenv('TOGETHER_API_KEY'):
-            together_keys.append(APIKey(os.getenv('TOGETHER_API_KEY'), 'together'))
-        
-        for i in range(1, 6):
-            key = os.getenv(f'TOGETHER_API_KEY_{i}')
-            if key:
-                together_keys.append(APIKey(key, 'together'))
+        for provider, env_name in API_KEY_ENV_VARS:
+            keys = []
+            base_key = os.getenv(env_name)
+            if base_key:
+                keys.append(APIKey(base_key, provider))
+            
+            # Support up to 5 numbered keys per provider; numbering must be contiguous
+            for i in range(1, 6):
+                key = os.getenv(f'{env_name}_{i}')
+                if not key:
+                    break
+                keys.append(APIKey(key, provider))
+            
+            if keys:
+                api_keys[provider] = tuple(keys)
         
-        if together_keys:
-            self.api_keys['together'] = together_keys
+        with self.lock:
+            self.api_keys = api_keys
+            # Running per-provider request totals so status reads don't sum over every key
+            self._agg_total = {provider: 0 for provider in api_keys}
+            self._agg_success = {provider: 0 for provider in api_keys}
         
-        logger.info(f"Loaded API keys: {[(provider, len(keys)) for provider, keys in self.api_keys.items()]}")
+        logger.info(f"Loaded API keys: {[(provider, len(keys)) for provider, keys in api_keys.items()]}")
     
-    def get_available_key(self, provider: str) -> Optional[APIKey]:
+    def get_available_key(self, provider: str, now: Optional[float] = None) -> Optional[APIKey]:
         """Get an available API key for the specified provider."""
-        with self.lock:
-            if provider not in self.api_keys:
-                return None
-            
-            # Filter active keys
-            active_keys = [key for key in self.api_keys[provider] if key.can_use()]
-            
-            if not active_keys:
-                # Try to reactivate failed keys after some time
-                for key in self.api_keys[provider]:
-                    if (key.last_failure and 
-                        datetime.now() - key.last_failure > timedelta(minutes=10)):
-                        key.is_active = True
-                        key.failure_count = max(0, key.failure_count - 1)
-                        active_keys.append(key)
-                        logger.info(f"Reactivated API key for {provider} after cooldown")
-            
-            if not active_keys:
-                return None
-            
-            # Return key with best success rate
-            return min(active_keys, key=lambda k: k.failure_count)
+        if now is None:
+            now = time.monotonic()
+        return self._select_key(provider, self.api_keys.get(provider, ()), now)
+    
+    def _scan_available_once(self, now: Optional[float] = None) -> Dict[str, Optional[APIKey]]:
+        """Select the best available key for every provider from one key snapshot."""
+        if now is None:
+            now = time.monotonic()
+        return {provider: self._select_key(provider, keys, now) for provider, keys in self.api_keys.items()}
+    
+    def _select_key(self, provider: str, keys: Tuple[APIKey, ...], now: float) -> Optional[APIKey]:
+        """Pick the best usable key for a provider from a published key snapshot."""
+        healthy = [key for key in keys if key.can_use(now)]
+        
+        if not healthy:
+            # Try to reactivate failed keys after some time
+            for key in keys:
+                if (key.last_failure and 
+                    now - key.last_failure > FAILED_KEY_COOLDOWN_SECONDS):
+                    key.is_active = True
+                    key.failure_count = max(0, key.failure_count - 1)
+                    healthy.append(key)
+                    logger.info(f"Reactivated API key for {provider} after cooldown")
+        
+        if not healthy:
+            return None
+        if len(healthy) == 1:
+            return healthy[0]
+        
+        # Spread load across healthy keys, weighted away from keys with recent failures
+        weights = [1.0 / (1 + key.failure_count) for key in healthy]
+        return random.choices(healthy, weights=weights, k=1)[0]
     
-    def get_ordered_providers(self, preferred_provider: Optional[str] = None) -> List[str]:
-        """Get providers ordered by priority and availability."""
+    def get_ordered_providers(self, preferred_provider: Optional[str] = None,
+                              now: Optional[float] = None) -> List[Tuple[str, APIKey]]:
+        """Get (provider, selected key) pairs ordered by priority and availability."""
+        available_keys = self._scan_available_once(now)
         available_providers = []
         
         # Add preferred provider first if available
-        if preferred_provider and preferred_provider in self.api_keys:
-            if self.get_available_key(preferred_provider):
-                available_providers.append(preferred_provider)
+        preferred_key = available_keys.get(preferred_provider) if preferred_provider else None
+        if preferred_key:
+            available_providers.append((preferred_provider, preferred_key))
         
         # Add other providers by priority
-        other_providers = [
-            (provider, config.priority) 
-            for provider, config in self.provider_configs.items()
-            if (provider != preferred_provider and 
-                provider in self.api_keys and 
-                self.get_available_key(provider) and
-                config.is_enabled)
-        ]
-        
-        # Sort by priority (lower number = higher priority)
-        other_providers.sort(key=lambda x: x[1])
-        available_providers.extend([provider for provider, _ in other_providers])
+        for provider, config in self._priority_sorted:
+            if provider == preferred_provider or not config.is_enabled:
+                continue
+            api_key = available_keys.get(provider)
+            if api_key:
+                available_providers.append((provider, api_key))
         
         return available_providers
     
-    def _get_cache_key(self, operation: str, **kwargs) -> str:
-        """Generate cache key for request."""
-        key_data = {
-            'operation': operation,
-            **kwargs
-        }
-        return json.dumps(key_data, sort_keys=True)
+    def _get_cache_key(self, operation: str, language: str, explain_level: str, payload: str) -> str:
+        """Generate a compact cache key, hashing the (possibly large) code or prompt."""
+        digest = hashlib.blake2b(payload.encode('utf-8', 'ignore'), digest_size=16).hexdigest()
+        return f"{operation}:{language}:{explain_level}:{digest}"
     
     def _get_cached_result(self, cache_key: str) -> Optional[Dict]:
         """Get cached result if available and not expired."""
-        if cache_key in self.cache:
-            result, timestamp = self.cache[cache_key]
-            if datetime.now() - timestamp < self.cache_ttl:
-                return result
-            else:
-                del self.cache[cache_key]
-        return None
+        with self.cache_lock:
+            return self.cache.get(cache_key)
     
     def _cache_result(self, cache_key: str, result: Dict):
         """Cache successful result."""
         if result.get('success'):
-            self.cache[cache_key] = (result, datetime.now())
+            with self.cache_lock:
+                self.cache[cache_key] = result
     
-    def _execute_with_provider(self, provider: str, operation: str, **kwargs) -> Dict:
-        """Execute operation with specific provider and handle errors."""
-        api_key = self.get_available_key(provider)
-        if not api_key:
-            return {
-                'success': False,
-                'error': f'No available API keys for provider {provider}',
-                'provider': provider
-            }
-        
+    def clear_cache(self) -> int:
+        """Drop all cached results, returning how many entries were removed."""
+        with self.cache_lock:
+            cache_size = len(self.cache)
+            self.cache.clear()
+        return cache_size
+    
+    def _execute_with_provider(self, provider: str, api_key: APIKey, operation: str, **kwargs) -> Dict:
+        """Execute operation with specific provider and an already-selected key, handling errors."""
         service = self.providers.get(provider)
         if not service:
-            return {
-                'success': False,
-                'error': f'Provider {provider} service not available',
-                'provider': provider
-            }
+            return _provider_error(provider, f'Provider {provider} service not available')
         
         try:
-            # Update service with current API key
-            if hasattr(service, 'api_key'):
-                service.api_key = api_key.key
-            if hasattr(service, '_initialize_client'):
-                service._initialize_client()
-            
-            # Execute operation
+            # Pass the selected key per call; the shared provider service is never mutated
             if operation == 'analyze_code':
                 result = service.analyze_code(
                     kwargs['code'], 
                     kwargs['language'], 
-                    kwargs.get('explain_level', 'medium')
+                    kwargs.get('explain_level', 'medium'),
+                    api_key=api_key.key
                 )
             elif operation == 'generate_code':
                 result = service.generate_code(
                     kwargs['prompt'], 
                     kwargs['language'], 
-                    kwargs.get('explain_level', 'medium')
+                    kwargs.get('explain_level', 'medium'),
+                    api_key=api_key.key
                 )
             else:
-                return {
-                    'success': False,
-                    'error': f'Unknown operation: {operation}',
-                    'provider': provider
-                }
+                return _provider_error(provider, f'Unknown operation: {operation}')
             
             if result.get('success'):
                 api_key.mark_success()
+                self._agg_total[provider] += 1
+                self._agg_success[provider] += 1
                 result['provider'] = provider
-                result['api_key_id'] = id(api_key)
+                result['api_key_id'] = api_key.key_id
                 return result
             else:
                 # Handle specific error types
@@ -320,52 +330,89 @@ class EnhancedAIService:
                 api_key.mark_failure('exception')
             
             logger.error(f"Error with provider {provider}: {e}")
-            return {
-                'success': False,
-                'error': f'Provider {provider} failed: {str(e)}',
-                'provider': provider
-            }
+            return _provider_error(provider, f'Provider {provider} failed: {str(e)}')
     
-    def analyze_code(self, code: str, language: str, explain_level: str = "medium", 
-                    preferred_provider: Optional[str] = None) -> Dict:
+    def _run_with_failover(self, providers: List[Tuple[str, APIKey]], operation: str, **kwargs) -> Tuple[Optional[Dict], List[str], Optional[str]]:
         """
-        Analyze code with automatic failover between providers.
+        Run an operation across providers, returning the first success.
+        
+        A provider that fails hands over to the next one immediately; one that is
+        still running after HEDGE_DELAY_SECONDS gets a hedged request to the next
+        provider alongside it.
+        
+        Returns:
+            Tuple of (successful result or None, attempted providers, last error)
         """
-        # Check cache first
-        cache_key = self._get_cache_key('analyze_code', code=code, language=language, explain_level=explain_level)
+        remaining = iter(providers)
+        futures = {}
+        attempted_providers = []
+        last_error = None
+        hedge_deadline = 0.0
+        # One worker per provider, owned by this call: an attempt never queues behind
+        # losing attempts (this request's or others') still running out their timeouts
+        executor = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix='ai-failover')
+        
+        def run_attempt(started, provider, api_key):
+            started.set()
+            return self._execute_with_provider(provider, api_key, operation, **kwargs)
+        
+        def submit_next():
+            nonlocal hedge_deadline
+            provider, api_key = next(remaining, (None, None))
+            if provider is None:
+                return
+            logger.info(f"Attempting {operation} with provider: {provider}")
+            attempted_providers.append(provider)
+            started = Event()
+            futures[executor.submit(run_attempt, started, provider, api_key)] = provider
+            # The hedge delay counts from when the attempt is actually running
+            started.wait()
+            hedge_deadline = time.monotonic() + HEDGE_DELAY_SECONDS
+        
+        try:
+            submit_next()
+            while futures:
+                has_more = len(attempted_providers) < len(providers)
+                timeout = max(0.0, hedge_deadline - time.monotonic()) if has_more else None
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                
+                if not done:
+                    logger.info(f"Provider {attempted_providers[-1]} is slow, hedging with the next provider")
+                    submit_next()
+                    continue
+                
+                for future in done:
+                    provider = futures.pop(future)
+                    result = future.result()
+                    if result.get('success'):
+                        # Losers keep running on their own threads; their results are discarded
+                        return result, attempted_providers, last_error
+                    last_error = result.get('error')
+                    logger.warning(f"Provider {provider} failed: {last_error}")
+                    submit_next()
+        finally:
+            # Don't block on losing attempts; their threads exit when the calls return
+            executor.shutdown(wait=False)
+        
+        return None, attempted_providers, last_error
+    
+    def _failover_operation(self, operation: str, cache_key: str, preferred_provider: Optional[str], **kwargs) -> Dict:
+        """Serve an operation from cache or run it with automatic failover between providers."""
         cached_result = self._get_cached_result(cache_key)
         if cached_result:
             cached_result['from_cache'] = True
             return cached_result
         
-        providers = self.get_ordered_providers(preferred_provider)
+        providers = self.get_ordered_providers(preferred_provider, time.monotonic())
         
         if not providers:
-            return {
-                'success': False,
-                'error': 'No AI providers available. Please check API key configuration.',
-                'available_providers': list(self.api_keys.keys())
-            }
-        
-        last_error = None
-        attempted_providers = []
+            return {**_NO_PROVIDERS_ERROR, 'available_providers': list(self.api_keys.keys())}
         
-        for provider in providers:
-            logger.info(f"Attempting code analysis with provider: {provider}")
-            attempted_providers.append(provider)
-            
-            result = self._execute_with_provider(
-                provider, 'analyze_code',
-                code=code, language=language, explain_level=explain_level
-            )
-            
-            if result.get('success'):
-                result['attempted_providers'] = attempted_providers
-                self._cache_result(cache_key, result)
-                return result
-            else:
-                last_error = result.get('error')
-                logger.warning(f"Provider {provider} failed: {last_error}")
+        result, attempted_providers, last_error = self._run_with_failover(providers, operation, **kwargs)
+        if result:
+            result['attempted_providers'] = attempted_providers
+            self._cache_result(cache_key, result)
+            return result
         
         # All providers failed
         return {
@@ -375,63 +422,37 @@ class EnhancedAIService:
             'available_providers': list(self.api_keys.keys())
         }
     
+    def analyze_code(self, code: str, language: str, explain_level: str = "medium", 
+                    preferred_provider: Optional[str] = None) -> Dict:
+        """
+        Analyze code with automatic failover between providers.
+        """
+        cache_key = self._get_cache_key('analyze_code', language, explain_level, code)
+        return self._failover_operation(
+            'analyze_code', cache_key, preferred_provider,
+            code=code, language=language, explain_level=explain_level
+        )
+    
     def generate_code(self, prompt: str, language: str, explain_level: str = "medium",
                      preferred_provider: Optional[str] = None) -> Dict:
         """
         Generate code with automatic failover between providers.
         """
-        # Check cache first
-        cache_key = self._get_cache_key('generate_code', prompt=prompt, language=language, explain_level=explain_level)
-        cached_result = self._get_cached_result(cache_key)
-        if cached_result:
-            cached_result['from_cache'] = True
-            return cached_result
-        
-        providers = self.get_ordered_providers(preferred_provider)
-        
-        if not providers:
-            return {
-                'success': False,
-                'error': 'No AI providers available. Please check API key configuration.',
-                'available_providers': list(self.api_keys.keys())
-            }
-        
-        last_error = None
-        attempted_providers = []
-        
-        for provider in providers:
-            logger.info(f"Attempting code generation with provider: {provider}")
-            attempted_providers.append(provider)
-            
-            result = self._execute_with_provider(
-                provider, 'generate_code',
-                prompt=prompt, language=language, explain_level=explain_level
-            )
-            
-            if result.get('success'):
-                result['attempted_providers'] = attempted_providers
-                self._cache_result(cache_key, result)
-                return result
-            else:
-                last_error = result.get('error')
-                logger.warning(f"Provider {provider} failed: {last_error}")
-        
-        # All providers failed
-        return {
-            'success': False,
-            'error': f'All providers failed. Last error: {last_error}',
-            'attempted_providers': attempted_providers,
-            'available_providers': list(self.api_keys.keys())
-        }
+        cache_key = self._get_cache_key('generate_code', language, explain_level, prompt)
+        return self._failover_operation(
+            'generate_code', cache_key, preferred_provider,
+            prompt=prompt, language=language, explain_level=explain_level
+        )
     
     def get_provider_status(self) -> Dict:
         """Get status of all providers and their API keys."""
         status = {}
+        now = time.monotonic()
         
         for provider, keys in self.api_keys.items():
-            active_keys = sum(1 for key in keys if key.can_use())
-            total_requests = sum(key.total_requests for key in keys)
-            successful_requests = sum(key.successful_requests for key in keys)
+            active_keys = sum(1 for key in keys if key.can_use(now))
+            total_requests = self._agg_total.get(provider, 0)
+            successful_requests = self._agg_success.get(provider, 0)
             
             status[provider] = {
                 'total_keys': len(keys),
@@ -462,20 +483,21 @@ class EnhancedAIService:
     
     def is_any_provider_configured(self) -> bool:
         """Check if any provider is configured and available."""
-        return any(self.get_available_key(provider) for provider in self.api_keys.keys())
+        return any(self._scan_available_once().values())
     
     def get_available_providers(self) -> Dict[str, bool]:
         """Get list of available providers."""
+        available_keys = self._scan_available_once()
         return {
-            provider: self.get_available_key(provider) is not None
+            provider: available_keys.get(provider) is not None
             for provider in self.provider_configs.keys()
         }
     
     def get_configured_providers(self) -> List[str]:
         """Get list of configured providers."""
         return [
-            provider for provider in self.api_keys.keys()
-            if self.get_available_key(provider)
+            provider for provider, key in self._scan_available_once().items()
+            if key
         ]
 
 # Global enhanced service instance
@@ -2,12 +2,14 @@
 Code execution service foundation.
 """
 
+import os
 import time
 import logging
+import importlib
 import threading
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from app.models.execution import ExecutionRequest, ExecutionResult, create_error_result
-from app.models.language import get_language_by_id
+from app.models.language import get_language_by_id, get_all_languages
 from app.security.resource_monitor import ResourceMonitor, create_resource_limits
 
 # Configure logging
@@ -20,46 +22,74 @@ class ExecutionService:
     def __init__(self):
         """Initialize the execution service."""
         self.executors = {}
-        self.execution_lock = threading.Lock()
+        # Executors use per-instance temp dirs, so runs can overlap; cap concurrent subprocesses at the core count
+        self.execution_slots = threading.BoundedSemaphore(os.cpu_count() or 1)
+        # Idle executor instances keyed by (language, timeout), reused across requests
+        self._executor_pool: Dict[Tuple[str, int], List[Any]] = {}
+        self._pool_lock = threading.Lock()
         self._load_language_executors()
+        # Language list is static; keep ordered ids for listing and a set for membership checks
+        self._supported_languages = [lang.id for lang in get_all_languages()]
+        self._supported_ids = frozenset(self._supported_languages)
     
     def _load_language_executors(self):
-        """Load language-specific executors."""
-        try:
-            # Import available executors
-            from app.executors.python_executor import PythonExecutor
-            from app.executors.javascript_executor import JavaScriptExecutor
-            from app.executors.java_executor import JavaExecutor
-            from app.executors.cpp_executor import CppExecutor
-            from app.executors.c_executor import CExecutor
-            from app.executors.csharp_executor import CSharpExecutor
-            from app.executors.php_executor import PhpExecutor
-            from app.executors.ruby_executor import RubyExecutor
-            from app.executors.go_executor import GoExecutor
-            from app.executors.rust_executor import RustExecutor
-            from app.executors.r_executor import RExecutor
-            from app.executors.typescript_executor import TypeScriptExecutor
-            
-            # Initialize executors
-            self.executors['python'] = PythonExecutor
-            self.executors['javascript'] = JavaScriptExecutor
-            self.executors['java'] = JavaExecutor
-            self.executors['cpp'] = CppExecutor
-            self.executors['c'] = CExecutor
-            self.executors['csharp'] = CSharpExecutor
-            self.executors['php'] = PhpExecutor
-            self.executors['ruby'] = RubyExecutor
-            self.executors['go'] = GoExecutor
-            self.executors['rust'] = RustExecutor
-            self.executors['r'] = RExecutor
-            self.executors['typescript'] = TypeScriptExecutor
-            
-            logger.info(f"Loaded executors for languages: {list(self.executors.keys())}")
+        """Register language-specific executors; modules are imported on first use."""
+        self.executors = {
+            'python': 'app.executors.python_executor:PythonExecutor',
+            'javascript': 'app.executors.javascript_executor:JavaScriptExecutor',
+            'java': 'app.executors.java_executor:JavaExecutor',
+            'cpp': 'app.executors.cpp_executor:CppExecutor',
+            'c': 'app.executors.c_executor:CExecutor',
+            'csharp': 'app.executors.csharp_executor:CSharpExecutor',
+            'php': 'app.executors.php_executor:PhpExecutor',
+            'ruby': 'app.executors.ruby_executor:RubyExecutor',
+            'go': 'app.executors.go_executor:GoExecutor',
+            'rust': 'app.executors.rust_executor:RustExecutor',
+            'r': 'app.executors.r_executor:RExecutor',
+            'typescript': 'app.executors.typescript_executor:TypeScriptExecutor',
+        }
+        
+        logger.info(f"Registered executors for languages: {list(self.executors.keys())}")
+    
+    def _resolve_executor(self, language_id: str):
+        """
+        Import the executor class for a language, caching it in place of its dotted path.
+        
+        Args:
+            language_id: Language identifier
             
+        Returns:
+            Executor class, or None if it could not be imported
+        """
+        executor = self.executors.get(language_id)
+        if not isinstance(executor, str):
+            return executor
+        
+        module_name, class_name = executor.split(':')
+        try:
+            executor_class = getattr(importlib.import_module(module_name), class_name)
         except ImportError as e:
-            logger.error(f"Failed to import executor: {e}")
+            logger.error(f"Failed to import executor for {language_id}: {e}")
+            return None
         except Exception as e:
-            logger.error(f"Error loading executors: {e}")
+            logger.error(f"Error loading executor for {language_id}: {e}")
+            return None
+        
+        self.executors[language_id] = executor_class
+        return executor_class
+    
+    def _acquire_executor(self, language_id: str, executor_class, timeout: int):
+        """Check out an idle executor for (language, timeout), creating one if none is free."""
+        with self._pool_lock:
+            idle = self._executor_pool.get((language_id, timeout))
+            if idle:
+                return idle.pop()
+        return executor_class(timeout=timeout)
+    
+    def _release_executor(self, language_id: str, timeout: int, executor):
+        """Return an executor to the idle pool once its run has cleaned up."""
+        with self._pool_lock:
+            self._executor_pool.setdefault((language_id, timeout), []).append(executor)
     
     def execute_code(self, request: ExecutionRequest) -> ExecutionResult:
         """
@@ -74,18 +104,15 @@ class ExecutionService:
         start_time = time.time()
         
         try:
-            # Validate the request
-            validation = request.validate()
-            if not validation['valid']:
+            # Validate and sanitize the request
+            valid, errors, sanitized_request = request.validate_and_sanitize()
+            if not valid:
                 return create_error_result(
                     'validation_error',
                     'Invalid execution request',
-                    '; '.join(validation['errors'])
+                    '; '.join(errors)
                 )
             
-            # Sanitize the request
-            sanitized_request = request.sanitize()
-            
             # Check if language is supported
             language = get_language_by_id(sanitized_request.language)
             if not language:
@@ -95,7 +122,8 @@ class ExecutionService:
                 )
             
             # Check if executor is available for this language
-            if sanitized_request.language not in self.executors:
+            executor_class = self._resolve_executor(sanitized_request.language)
+            if executor_class is None:
                 logger.warning(f"No executor available for language: {sanitized_request.language}")
                 return create_error_result(
                     'executor_not_available',
@@ -106,12 +134,11 @@ class ExecutionService:
             # Log execution attempt
             logger.info(f"Executing {language.name} code (length: {len(sanitized_request.code)} chars)")
             
-            # Use thread lock to prevent concurrent executions from interfering
-            with self.execution_lock:
-                # Get executor class and create instance
-                executor_class = self.executors[sanitized_request.language]
+            # Bound concurrent executions without serializing them
+            with self.execution_slots:
+                # Check out an executor instance
                 timeout = sanitized_request.timeout or language.timeout_seconds
-                executor = executor_class(timeout=timeout)
+                executor = self._acquire_executor(sanitized_request.language, executor_class, timeout)
                 
                 try:
                     # Execute the code
@@ -119,6 +146,8 @@ class ExecutionService:
                         sanitized_request.code,
                         sanitized_request.input
                     )
+                    # Executors clean up their temp files after every run, so the instance can be reused
+                    self._release_executor(sanitized_request.language, timeout, executor)
                     
                     # Log execution result
                     execution_time = time.time() - start_time
@@ -164,8 +193,7 @@ class ExecutionService:
         Returns:
             List of supported language IDs
         """
-        from app.models.language import get_all_languages
-        return [lang.id for lang in get_all_languages()]
+        return list(self._supported_languages)
     
     def get_available_executors(self) -> list:
         """
@@ -186,7 +214,7 @@ class ExecutionService:
         Returns:
             True if language is supported, False otherwise
         """
-        return language_id in self.get_supported_languages()
+        return language_id in self._supported_ids
     
     def is_executor_available(self, language_id: str) -> bool:
         """
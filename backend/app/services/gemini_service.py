@@ -4,10 +4,13 @@ Google Gemini API service for code analysis and generation.
 
 import os
 import logging
-import json
+import difflib
+import threading
 from typing import Dict, List, Optional
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 from flask import current_app
+from .json_envelope import load_json_envelope
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +18,10 @@ class GeminiService:
     def __init__(self):
         self.client = None
         self.api_key = None
+        # genai.configure is process-global; the lock covers configuring a key and binding a
+        # model to the transport built from it. Calls then run outside the lock.
+        self._configure_lock = threading.Lock()
+        self._key_clients: Dict[str, genai.GenerativeModel] = {}
         self._initialize_client()
     
     def _initialize_client(self):
@@ -22,8 +29,7 @@ class GeminiService:
         self.api_key = os.getenv('GEMINI_API_KEY')
         if self.api_key:
             try:
-                genai.configure(api_key=self.api_key)
-                self.client = genai.GenerativeModel('gemini-1.5-flash')
+                self.client = self._get_key_client(self.api_key)
                 logger.info("Gemini service initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Gemini client: {e}")
@@ -35,7 +41,41 @@ class GeminiService:
         """Check if Gemini service is properly configured."""
         return self.client is not None and self.api_key is not None
     
-    def analyze_code(self, code: str, language: str, explain_level: str = "medium") -> Dict:
+    def _resolve_key(self, api_key: Optional[str] = None) -> Optional[str]:
+        """Return the key a call should use: the supplied one, else the configured default."""
+        if api_key:
+            return api_key
+        return self.api_key if self.is_configured() else None
+    
+    def _get_key_client(self, api_key: str) -> genai.GenerativeModel:
+        """Return the model for api_key, bound on first use to a transport carrying that key."""
+        client = self._key_clients.get(api_key)
+        if client is not None:
+            return client
+        
+        with self._configure_lock:
+            client = self._key_clients.get(api_key)
+            if client is None:
+                genai.configure(api_key=api_key)
+                client = genai.GenerativeModel('gemini-1.5-flash')
+                # A model resolves its transport from the global config only while _client is
+                # unset, so binding it now pins this key regardless of later configure() calls
+                client._client = genai_client.get_default_generative_client()
+                self._key_clients[api_key] = client
+        return client
+    
+    def _generate_content(self, api_key: str, prompt: str):
+        """Run generate_content on the model bound to api_key."""
+        return self._get_key_client(api_key).generate_content(
+            prompt,
+            generation_config=genai.types.GenerationConfig(
+                max_output_tokens=2000,
+                temperature=0.3,
+            )
+        )
+    
+    def analyze_code(self, code: str, language: str, explain_level: str = "medium",
+                    api_key: Optional[str] = None) -> Dict:
         """
         Analyze code and provide corrections, explanations, and examples.
         
@@ -43,11 +83,13 @@ class GeminiService:
             code: The code to analyze
             language: Programming language
             explain_level: "short", "medium", or "long"
+            api_key: Optional key to use instead of the configured one
         
         Returns:
             Dict containing analysis results
         """
-        if not self.is_configured():
+        key = self._resolve_key(api_key)
+        if key is None:
             return {
                 'success': False,
                 'error': 'Gemini service not configured. Please set GEMINI_API_KEY.'
@@ -56,13 +98,7 @@ class GeminiService:
         try:
             prompt = self._create_analysis_prompt(code, language, explain_level)
             
-            response = self.client.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=2000,
-                    temperature=0.3,
-                )
-            )
+            response = self._generate_content(key, prompt)
             
             analysis_text = response.text
             
@@ -81,7 +117,8 @@ class GeminiService:
                 'error': f'Analysis failed: {str(e)}'
             }
     
-    def generate_code(self, prompt: str, language: str, explain_level: str = "medium") -> Dict:
+    def generate_code(self, prompt: str, language: str, explain_level: str = "medium",
+                     api_key: Optional[str] = None) -> Dict:
         """
         Generate code based on user prompt.
         
@@ -89,11 +126,13 @@ class GeminiService:
             prompt: User's code generation request
             language: Target programming language
             explain_level: Level of explanation detail
+            api_key: Optional key to use instead of the configured one
         
         Returns:
             Dict containing generated code and explanation
         """
-        if not self.is_configured():
+        key = self._resolve_key(api_key)
+        if key is None:
             return {
                 'success': False,
                 'error': 'Gemini service not configured. Please set GEMINI_API_KEY.'
@@ -102,13 +141,7 @@ class GeminiService:
         try:
             generation_prompt = self._create_generation_prompt(prompt, language, explain_level)
             
-            response = self.client.generate_content(
-                generation_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=2000,
-                    temperature=0.3,
-                )
-            )
+            response = self._generate_content(key, generation_prompt)
             
             generation_text = response.text
             
@@ -204,53 +237,32 @@ Please provide your response in the following JSON format:
     
     def _parse_analysis_response(self, response_text: str, original_code: str, language: str) -> Dict:
         """Parse Gemini analysis response into structured format."""
-        try:
-            # Try to extract JSON from the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                parsed = json.loads(json_str)
-                
-                # Add diff information if corrections exist
-                if parsed.get('corrections', {}).get('corrected_code'):
-                    parsed['corrections']['diff'] = self._generate_diff(
-                        original_code, 
-                        parsed['corrections']['corrected_code']
-                    )
-                
-                return parsed
-            else:
-                # Fallback: create structured response from text
-                return self._create_fallback_analysis(response_text, original_code)
-                
-        except json.JSONDecodeError:
+        # Try to extract JSON from the response
+        parsed = load_json_envelope(response_text)
+        if parsed is None:
             # Fallback: create structured response from text
             return self._create_fallback_analysis(response_text, original_code)
+        
+        # Add diff information if corrections exist
+        if parsed.get('corrections', {}).get('corrected_code'):
+            parsed['corrections']['diff'] = self._generate_diff(
+                original_code, 
+                parsed['corrections']['corrected_code']
+            )
+        
+        return parsed
     
     def _parse_generation_response(self, response_text: str, language: str) -> Dict:
         """Parse Gemini generation response into structured format."""
-        try:
-            # Try to extract JSON from the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                # Fallback: create structured response from text
-                return self._create_fallback_generation(response_text)
-                
-        except json.JSONDecodeError:
+        # Try to extract JSON from the response
+        parsed = load_json_envelope(response_text)
+        if parsed is None:
             # Fallback: create structured response from text
             return self._create_fallback_generation(response_text)
+        return parsed
     
     def _generate_diff(self, original: str, corrected: str) -> List[Dict]:
         """Generate diff between original and corrected code."""
-        import difflib
-        
         original_lines = original.splitlines()
         corrected_lines = corrected.splitlines()
         
@@ -3,21 +3,40 @@ Git service for handling git operations and diff generation.
 """
 
 import os
+import re
+import codecs
+import time
+import difflib
+import threading
 import subprocess
+import shutil
 import logging
-from typing import Dict, List, Optional, Tuple
+import functools
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Environment for every git subprocess, built once: C locale skips gettext setup,
+# optional locks off keeps read-only status calls from rewriting the index,
+# and no terminal prompt means a credential request fails fast instead of hanging
+_GIT_ENV = {
+    **os.environ,
+    'LC_ALL': 'C',
+    'GIT_OPTIONAL_LOCKS': '0',
+    'GIT_TERMINAL_PROMPT': '0',
+}
+
+@dataclass(slots=True, frozen=True)
 class GitDiffLine:
     """Represents a line in a git diff."""
     line_number: int
     content: str
     type: str  # 'added', 'removed', 'context'
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class GitDiffResult:
     """Represents the result of a git diff operation."""
     success: bool
@@ -27,56 +46,235 @@ class GitDiffResult:
     added_lines: int = 0
     removed_lines: int = 0
 
+# Diff line type by first byte; the prefix itself is stripped from the content
+_DIFF_LINE_TYPES = {ord('+'): 'added', ord('-'): 'removed', ord(' '): 'context'}
+_DIFF_FILE_HEADERS = (b'+++', b'---')
+# Start of each per-file section of a multi-file diff
+_DIFF_SECTION_RE = re.compile(rb'^diff --git ', re.MULTILINE)
+# Header of a section with no ---/+++ lines (mode-only change); same path on both sides,
+# which the backreference checks so paths with spaces stay intact
+_DIFF_SAME_PATH_HEADER_RE = re.compile(rb'^diff --git (?:a/(.+) b/\1|"a/(.+)" "b/\2")$')
+# Extended header lines naming a path as-is (no a/ or b/ prefix)
+_DIFF_PATH_HEADERS = (b'rename from ', b'rename to ', b'copy from ', b'copy to ')
+_HUNK_HEADER = b'@@'
+_HUNK_PREFIX = ord('@')
+_ADDED_PREFIX = ord('+')
+_REMOVED_PREFIX = ord('-')
+_CONTEXT_PREFIX = ord(' ')
+
+def _unquote_path(raw: bytes) -> str:
+    """Decode a path from a diff header, undoing git's C-style quoting of unusual names."""
+    if len(raw) >= 2 and raw.startswith(b'"') and raw.endswith(b'"'):
+        raw = codecs.escape_decode(raw[1:-1])[0]
+    return raw.decode('utf-8', 'replace')
+
+def _diff_section_paths(section: bytes) -> List[str]:
+    """
+    Repository-relative paths a per-file diff section touches; both sides of a rename.
+    
+    Empty when the section names no path in a form this parser understands.
+    """
+    paths = []
+    for line in section.split(b'\n'):
+        if line.startswith(_HUNK_HEADER):
+            break
+        if line.startswith(_DIFF_FILE_HEADERS):
+            # git appends a tab to ---/+++ names that contain spaces
+            name = _unquote_path(line[4:].rstrip(b'\t'))
+            if name.startswith(('a/', 'b/')):
+                paths.append(name[2:])
+        elif line.startswith(_DIFF_PATH_HEADERS):
+            paths.append(_unquote_path(line.split(b' ', 2)[2]))
+    
+    if not paths:
+        header = _DIFF_SAME_PATH_HEADER_RE.match(section.split(b'\n', 1)[0])
+        if header:
+            if header.group(1) is not None:
+                paths.append(header.group(1).decode('utf-8', 'replace'))
+            else:
+                paths.append(_unquote_path(b'"' + header.group(2) + b'"'))
+    return paths
+
+def _decode_line(line: bytes) -> str:
+    """Decode one diff line, dropping the CR of CRLF line endings."""
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    return line.decode('utf-8', 'replace')
+
+# Unchanged lines git emits around each change unless a caller asks otherwise
+DEFAULT_CONTEXT_LINES = 3
+
+# Bound on memoized status/diff results
+STATUS_CACHE_SIZE = 64
+# Working-tree edits don't touch any git metadata, so results that read the
+# working tree are also capped by age
+WORKTREE_CACHE_TTL = 2.0
+
+@functools.lru_cache(maxsize=None)
+def _check_git_availability() -> bool:
+    """Check once per process whether a git executable is on PATH."""
+    if shutil.which('git') is None:
+        logger.warning("Git not available: git executable not found on PATH")
+        return False
+    return True
+
 class GitService:
     """Service for handling git operations."""
     
     def __init__(self):
-        self.git_available = self._check_git_availability()
-    
-    def _check_git_availability(self) -> bool:
-        """Check if git is available in the system."""
-        try:
-            result = subprocess.run(['git', '--version'], 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=5)
-            return result.returncode == 0
-        except Exception as e:
-            logger.warning(f"Git not available: {e}")
-            return False
+        self.git_available = _check_git_availability()
+        # abspath -> (mtime stamp, (toplevel, gitdir, inside_work_tree, cdup) or None)
+        self._repo_info_cache: Dict[str, Tuple[int, Optional[Tuple[str, str, bool, str]]]] = {}
+        # (operation, args) -> (metadata stamp, monotonic time stored, result)
+        self._status_cache: "OrderedDict[Tuple, Tuple[Tuple, float, Any]]" = OrderedDict()
+        self._status_cache_lock = threading.Lock()
+        # Background git calls so request handlers can overlap them with other I/O
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='git')
     
-    def _run_git_command(self, command: List[str], cwd: str = None) -> Tuple[bool, str, str]:
-        """Run a git command and return success, stdout, stderr."""
+    def _run_git_command(self, command: List[str], cwd: str = None,
+                         binary: bool = False) -> Tuple[bool, Union[str, bytes], str]:
+        """
+        Run a git command and return success, stdout, stderr.
+        
+        With binary=True stdout is returned as raw bytes, skipping the decode and
+        newline translation of the whole output; stderr is always decoded.
+        """
+        empty = b"" if binary else ""
         try:
-            result = subprocess.run(
+            process = subprocess.Popen(
                 ['git'] + command,
-                capture_output=True,
-                text=True,
-                timeout=30,
-                cwd=cwd
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                env=_GIT_ENV
             )
-            return result.returncode == 0, result.stdout, result.stderr
-        except subprocess.TimeoutExpired:
-            return False, "", "Git command timed out"
+            try:
+                stdout, stderr = process.communicate(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                return False, empty, "Git command timed out"
+            
+            if not binary:
+                stdout = stdout.decode('utf-8', 'replace').replace('\r\n', '\n')
+            return process.returncode == 0, stdout, stderr.decode('utf-8', 'replace')
         except Exception as e:
-            return False, "", str(e)
+            return False, empty, str(e)
+    
+    def _resolve_repo(self, path: str = ".") -> Optional[Tuple[str, str, bool, str]]:
+        """
+        Resolve (toplevel, gitdir, inside_work_tree, cdup) for a path with a single rev-parse.
+        
+        Results are cached per path and re-resolved when the git dir's mtime changes,
+        or for paths outside a repository, when the path's own mtime changes.
+        """
+        key = os.path.abspath(path)
+        cached = self._repo_info_cache.get(key)
+        if cached:
+            stamp, info = cached
+            try:
+                current = os.stat(info[1] if info else key).st_mtime_ns
+            except OSError:
+                current = None
+            if current == stamp:
+                return info
+        
+        success, stdout, _ = self._run_git_command(
+            ['rev-parse', '--show-toplevel', '--git-dir', '--is-inside-work-tree', '--show-cdup'],
+            cwd=path
+        )
+        info = None
+        if success:
+            parts = stdout.split('\n')
+            if len(parts) >= 3:
+                toplevel, gitdir, inside = parts[0], parts[1], parts[2]
+                cdup = parts[3] if len(parts) > 3 else ''
+                info = (toplevel, os.path.join(key, gitdir), inside == 'true', cdup)
+        
+        try:
+            stamp = os.stat(info[1] if info else key).st_mtime_ns
+        except OSError:
+            return info
+        self._repo_info_cache[key] = (stamp, info)
+        return info
+    
+    def refresh(self):
+        """Forget cached repository information and memoized results."""
+        self._repo_info_cache.clear()
+        with self._status_cache_lock:
+            self._status_cache.clear()
+    
+    def _metadata_stamp(self, gitdir: str) -> Tuple:
+        """mtimes of the index, HEAD, the branch HEAD points at, and packed-refs."""
+        paths = [os.path.join(gitdir, 'index'), os.path.join(gitdir, 'HEAD'),
+                 os.path.join(gitdir, 'packed-refs')]
+        try:
+            with open(paths[1], 'r') as head:
+                head_ref = head.read().strip()
+            if head_ref.startswith('ref: '):
+                paths.append(os.path.join(gitdir, head_ref[5:]))
+        except OSError:
+            pass
+        
+        stamp = []
+        for path in paths:
+            try:
+                stamp.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamp.append(0)
+        return tuple(stamp)
+    
+    def _memoized(self, key: Tuple, reads_worktree: bool, compute: Callable[[], Tuple[Any, bool]]) -> Any:
+        """
+        Return a cached result while the repository metadata is unchanged.
+        
+        compute returns (result, cacheable). Results that depend on the working
+        tree are additionally limited to WORKTREE_CACHE_TTL seconds.
+        """
+        info = self._resolve_repo()
+        if info is None:
+            return compute()[0]
+        
+        stamp = self._metadata_stamp(info[1])
+        now = time.monotonic()
+        with self._status_cache_lock:
+            cached = self._status_cache.get(key)
+            if cached and cached[0] == stamp and (not reads_worktree or now - cached[1] < WORKTREE_CACHE_TTL):
+                self._status_cache.move_to_end(key)
+                return cached[2]
+        
+        result, cacheable = compute()
+        if cacheable:
+            with self._status_cache_lock:
+                self._status_cache[key] = (stamp, now, result)
+                self._status_cache.move_to_end(key)
+                while len(self._status_cache) > STATUS_CACHE_SIZE:
+                    self._status_cache.popitem(last=False)
+        return result
     
     def is_git_repository(self, path: str = ".") -> bool:
         """Check if the given path is a git repository."""
         if not self.git_available:
             return False
         
-        success, _, _ = self._run_git_command(['rev-parse', '--git-dir'], cwd=path)
-        return success
+        info = self._resolve_repo(path)
+        return info is not None and info[2]
     
-    def get_current_diff(self, file_path: str = None, staged: bool = False) -> GitDiffResult:
+    def get_current_diff(self, file_path: str = None, staged: bool = False,
+                         summary_only: bool = False,
+                         context_lines: int = DEFAULT_CONTEXT_LINES) -> GitDiffResult:
         """
         Get the current git diff.
         
         Args:
             file_path: Specific file to diff (optional)
             staged: Whether to get staged changes (default: unstaged)
+            summary_only: Only count changes, leaving diff_lines empty (see get_diff_summary)
+            context_lines: Unchanged lines around each change; 0 for changed lines only
         """
+        if summary_only:
+            return self.get_diff_summary(file_path=file_path, staged=staged)
+        
         if not self.git_available:
             return GitDiffResult(
                 success=False,
@@ -84,14 +282,128 @@ class GitService:
                 error="Git is not available on this system"
             )
         
-        # Build git diff command
+        return self._memoized(
+            ('diff', file_path, staged, context_lines),
+            not staged,
+            lambda: self._compute_diff(file_path, staged, context_lines)
+        )
+    
+    def get_current_diff_many(self, paths: List[str], staged: bool = False) -> Dict[str, GitDiffResult]:
+        """
+        Get diffs for several files with a single git invocation.
+        
+        Args:
+            paths: File paths, relative to the working directory
+            staged: Whether to get staged changes (default: unstaged)
+            
+        Returns:
+            Dict mapping each requested path to its GitDiffResult
+        """
+        if not self.git_available:
+            error = GitDiffResult(
+                success=False,
+                diff_lines=[],
+                error="Git is not available on this system"
+            )
+            return {path: error for path in paths}
+        if not paths:
+            return {}
+        
+        return self._memoized(
+            ('diff_many', tuple(paths), staged),
+            not staged,
+            lambda: self._compute_diff_many(paths, staged)
+        )
+    
+    def _compute_diff_many(self, paths: List[str], staged: bool) -> Tuple[Dict[str, GitDiffResult], bool]:
+        """Run one git diff over several paths and split it per file, returning (results, cacheable)."""
         command = ['diff']
         if staged:
             command.append('--staged')
+        command.extend(['--unified=3', '--no-color', '--'])
+        command.extend(paths)
+        
+        success, stdout, stderr = self._run_git_command(command, binary=True)
+        
+        if not success:
+            error = GitDiffResult(
+                success=False,
+                diff_lines=[],
+                error=f"Git diff failed: {stderr}"
+            )
+            return {path: error for path in paths}, False
+        
+        # Split the output into per-file sections keyed by repository-relative path
+        sections = {}
+        unattributed = False
+        starts = [match.start() for match in _DIFF_SECTION_RE.finditer(stdout)]
+        for index, start in enumerate(starts):
+            end = starts[index + 1] if index + 1 < len(starts) else len(stdout)
+            section = stdout[start:end].rstrip(b'\n')
+            section_paths = _diff_section_paths(section)
+            if not section_paths:
+                unattributed = True
+            for section_path in section_paths:
+                sections[os.path.normpath(section_path)] = section
+        
+        # Diff headers are relative to the repository root; requested paths to the working directory
+        info = self._resolve_repo()
+        prefix = os.path.relpath(os.getcwd(), info[0]) if info else '.'
+        
+        results = {}
+        for path in paths:
+            section = sections.get(os.path.normpath(os.path.join(prefix, path)))
+            if section is None:
+                if unattributed:
+                    # Some section couldn't be matched to a path; it may be this file's
+                    results[path] = GitDiffResult(
+                        success=False,
+                        diff_lines=[],
+                        error="Could not match git diff output to this file"
+                    )
+                else:
+                    results[path] = GitDiffResult(success=True, diff_lines=[])
+                continue
+            diff_lines, added_lines, removed_lines = self._parse_diff_output(section)
+            results[path] = GitDiffResult(
+                success=True,
+                diff_lines=diff_lines,
+                has_changes=bool(diff_lines),
+                added_lines=added_lines,
+                removed_lines=removed_lines
+            )
+        return results, not unattributed
+    
+    def submit_current_diff(self, file_path: str = None, staged: bool = False) -> Future:
+        """Start get_current_diff in the background and return a Future for its GitDiffResult."""
+        return self._executor.submit(self.get_current_diff, file_path, staged)
+    
+    def get_diff_summary(self, file_path: str = None, staged: bool = False) -> GitDiffResult:
+        """
+        Get added/removed line counts without transferring or parsing the full diff.
         
-        # Add unified diff format with more context
-        command.extend(['--unified=3', '--no-color'])
+        Args:
+            file_path: Specific file to diff (optional)
+            staged: Whether to get staged changes (default: unstaged)
+        """
+        if not self.git_available:
+            return GitDiffResult(
+                success=False,
+                diff_lines=[],
+                error="Git is not available on this system"
+            )
         
+        return self._memoized(
+            ('numstat', file_path, staged),
+            not staged,
+            lambda: self._compute_diff_summary(file_path, staged)
+        )
+    
+    def _compute_diff_summary(self, file_path: Optional[str], staged: bool) -> Tuple[GitDiffResult, bool]:
+        """Run git diff --numstat and total it, returning (result, cacheable)."""
+        command = ['diff', '--numstat', '--no-color']
+        if staged:
+            command.append('--staged')
         if file_path:
             command.append(file_path)
         
@@ -102,15 +414,53 @@ class GitService:
                 success=False,
                 diff_lines=[],
                 error=f"Git diff failed: {stderr}"
-            )
+            ), False
+        
+        added_lines = 0
+        removed_lines = 0
+        has_changes = False
+        for line in stdout.splitlines():
+            added, removed, _ = line.split('\t', 2)
+            has_changes = True
+            # Binary files report '-' for both counts
+            if added != '-':
+                added_lines += int(added)
+                removed_lines += int(removed)
         
-        # Parse the diff output
-        diff_lines = self._parse_diff_output(stdout)
+        return GitDiffResult(
+            success=True,
+            diff_lines=[],
+            has_changes=has_changes,
+            added_lines=added_lines,
+            removed_lines=removed_lines
+        ), True
+    
+    def _compute_diff(self, file_path: Optional[str], staged: bool,
+                      context_lines: int = DEFAULT_CONTEXT_LINES) -> Tuple[GitDiffResult, bool]:
+        """Run git diff and parse it, returning (result, cacheable)."""
+        # Build git diff command
+        command = ['diff']
+        if staged:
+            command.append('--staged')
+        
+        # Add unified diff format with the requested context
+        command.extend([f'--unified={context_lines}', '--no-color'])
+        
+        if file_path:
+            command.append(file_path)
         
-        # Calculate statistics
-        added_lines = sum(1 for line in diff_lines if line.type == 'added')
-        removed_lines = sum(1 for line in diff_lines if line.type == 'removed')
-        has_changes = len(diff_lines) > 0
+        success, stdout, stderr = self._run_git_command(command, binary=True)
+        
+        if not success:
+            return GitDiffResult(
+                success=False,
+                diff_lines=[],
+                error=f"Git diff failed: {stderr}"
+            ), False
+        
+        # Parse the diff output, counting changes in the same pass
+        diff_lines, added_lines, removed_lines = self._parse_diff_output(stdout)
+        has_changes = bool(diff_lines)
         
         return GitDiffResult(
             success=True,
@@ -118,56 +468,52 @@ class GitService:
             has_changes=has_changes,
             added_lines=added_lines,
             removed_lines=removed_lines
-        )
+        ), True
     
-    def _parse_diff_output(self, diff_output: str) -> List[GitDiffLine]:
-        """Parse git diff output into structured diff lines."""
-        lines = diff_output.split('\n')
+    def _parse_diff_output(self, diff_output: bytes) -> Tuple[List[GitDiffLine], int, int]:
+        """
+        Parse raw git diff output into structured diff lines plus added/removed counts.
+        
+        Works on bytes so only the content of emitted lines is ever decoded.
+        """
         diff_lines = []
-        line_number = 0
+        append = diff_lines.append
+        added = 0
+        removed = 0
         
-        for line in lines:
-            line_number += 1
-            
-            if line.startswith('+++') or line.startswith('---'):
-                # File headers
+        for line_number, line in enumerate(diff_output.split(b'\n'), 1):
+            if not line:
+                append(GitDiffLine(line_number=line_number, content='', type='context'))
                 continue
-            elif line.startswith('@@'):
+            
+            prefix = line[0]
+            if prefix == _HUNK_PREFIX:
                 # Hunk headers
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line,
-                    type='context'
-                ))
-            elif line.startswith('+'):
-                # Added lines
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line[1:],  # Remove the + prefix
-                    type='added'
-                ))
-            elif line.startswith('-'):
-                # Removed lines
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line[1:],  # Remove the - prefix
-                    type='removed'
-                ))
-            elif line.startswith(' ') or line == '':
-                # Context lines
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line[1:] if line.startswith(' ') else line,
-                    type='context'
-                ))
+                if line.startswith(_HUNK_HEADER):
+                    append(GitDiffLine(line_number=line_number, content=_decode_line(line), type='context'))
+                continue
+            
+            line_type = _DIFF_LINE_TYPES.get(prefix)
+            if line_type is None or (prefix != _CONTEXT_PREFIX and line.startswith(_DIFF_FILE_HEADERS)):
+                # File headers and git metadata lines
+                continue
+            if prefix == _ADDED_PREFIX:
+                added += 1
+            elif prefix == _REMOVED_PREFIX:
+                removed += 1
+            append(GitDiffLine(line_number=line_number, content=_decode_line(line[1:]), type=line_type))
         
-        return diff_lines
+        return diff_lines, added, removed
     
     def get_file_status(self, file_path: str = None) -> Dict[str, str]:
         """Get the status of files in the repository."""
         if not self.git_available:
             return {}
         
+        return self._memoized(('status', file_path), True, lambda: self._compute_file_status(file_path))
+    
+    def _compute_file_status(self, file_path: Optional[str]) -> Tuple[Dict[str, str], bool]:
+        """Run git status, returning (status map, cacheable)."""
         command = ['status', '--porcelain']
         if file_path:
             command.append(file_path)
@@ -176,7 +522,7 @@ class GitService:
         
         if not success:
             logger.error(f"Git status failed: {stderr}")
-            return {}
+            return {}, False
         
         # Parse status output
         status_map = {}
@@ -186,18 +532,41 @@ class GitService:
                 file_name = line[3:]
                 status_map[file_name] = status_code.strip()
         
-        return status_map
+        return status_map, True
+    
+    def get_head_commit(self) -> Optional[str]:
+        """Return the commit hash HEAD points at, or None outside a repository or before the first commit."""
+        if not self.git_available:
+            return None
+        
+        return self._memoized(('head',), False, self._compute_head_commit)
+    
+    def _compute_head_commit(self) -> Tuple[Optional[str], bool]:
+        """Run rev-parse HEAD, returning (hash or None, cacheable)."""
+        success, stdout, _ = self._run_git_command(['rev-parse', '--verify', '--quiet', 'HEAD'])
+        return (stdout.strip() or None) if success else None, success
+    
+    def snapshot(self, file_path: str = None, staged: bool = False) -> Dict[str, Any]:
+        """
+        Collect diff, status and HEAD for one panel refresh, running the git calls concurrently.
+        
+        Returns:
+            Dict with 'diff' (GitDiffResult), 'status' (path -> status code) and 'head'
+        """
+        diff_future = self.submit_current_diff(file_path, staged)
+        status_future = self._executor.submit(self.get_file_status, file_path)
+        head = self.get_head_commit()
+        return {
+            'diff': diff_future.result(),
+            'status': status_future.result(),
+            'head': head
+        }
     
     def create_diff_from_code_changes(self, original_code: str, modified_code: str) -> List[GitDiffLine]:
         """Create a diff from two code strings (useful for showing AI-generated changes)."""
-        import difflib
-        
         original_lines = original_code.split('\n')
         modified_lines = modified_code.split('\n')
         
-        diff_lines = []
-        line_number = 0
-        
         # Use difflib to generate unified diff
         diff = difflib.unified_diff(
             original_lines,
@@ -207,36 +576,12 @@ class GitService:
             lineterm=''
         )
         
-        for line in diff:
-            line_number += 1
-            
-            if line.startswith('+++') or line.startswith('---'):
-                continue
-            elif line.startswith('@@'):
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line,
-                    type='context'
-                ))
-            elif line.startswith('+'):
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line[1:],
-                    type='added'
-                ))
-            elif line.startswith('-'):
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line[1:],
-                    type='removed'
-                ))
-            else:
-                diff_lines.append(GitDiffLine(
-                    line_number=line_number,
-                    content=line[1:] if line.startswith(' ') else line,
-                    type='context'
-                ))
+        diff_output = '\n'.join(diff).encode('utf-8')
+        if not diff_output:
+            return []
         
+        # difflib only emits headers, hunks and +/-/space lines, so the git parser applies as is
+        diff_lines, _, _ = self._parse_diff_output(diff_output)
         return diff_lines
 
 # Global service instance
@@ -4,17 +4,44 @@ GPT API service for code analysis and generation.
 
 import os
 import logging
-import json
+import difflib
+import threading
+import importlib.util
 from typing import Dict, List, Optional, Tuple
+import httpx
 from openai import OpenAI
 from flask import current_app
+from .json_envelope import load_json_envelope
 
 logger = logging.getLogger(__name__)
 
+GPT_MODEL = "gpt-3.5-turbo"
+
+# Keep-alive pool shared by every OpenAI client so calls reuse TCP/TLS connections
+HTTP_KEEPALIVE_CONNECTIONS = 32
+HTTP_MAX_CONNECTIONS = 64
+HTTP_KEEPALIVE_EXPIRY = 60.0
+
+def _build_http_client() -> httpx.Client:
+    """Create the pooled HTTP client used for OpenAI requests; HTTP/2 when h2 is installed."""
+    return httpx.Client(
+        http2=importlib.util.find_spec('h2') is not None,
+        timeout=30.0,
+        limits=httpx.Limits(
+            max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+            max_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
 class GPTService:
     def __init__(self):
         self.client = None
         self.api_key = None
+        # Clients for rotated keys passed per call, kept so each key reuses its connection pool
+        self._key_clients: Dict[str, OpenAI] = {}
+        self._key_clients_lock = threading.Lock()
+        self._http_client = _build_http_client()
         self._initialize_client()
     
     def _initialize_client(self):
@@ -27,7 +54,8 @@ class GPTService:
                 self.client = OpenAI(
                     api_key=self.api_key,
                     timeout=30.0,
-                    max_retries=3
+                    max_retries=3,
+                    http_client=self._http_client
                 )
                 logger.info("GPT service initialized successfully")
             except Exception as e:
@@ -40,7 +68,23 @@ class GPTService:
         """Check if GPT service is properly configured."""
         return self.client is not None and self.api_key is not None
     
-    def analyze_code(self, code: str, language: str, explain_level: str = "medium") -> Dict:
+    def _get_client(self, api_key: Optional[str] = None) -> Optional[OpenAI]:
+        """Return the default client, or a cached client for an explicitly supplied key."""
+        if not api_key or api_key == self.api_key:
+            return self.client if self.is_configured() else None
+        
+        client = self._key_clients.get(api_key)
+        if client is None:
+            with self._key_clients_lock:
+                client = self._key_clients.get(api_key)
+                if client is None:
+                    client = OpenAI(api_key=api_key, timeout=30.0, max_retries=3,
+                                    http_client=self._http_client)
+                    self._key_clients[api_key] = client
+        return client
+    
+    def analyze_code(self, code: str, language: str, explain_level: str = "medium",
+                    api_key: Optional[str] = None) -> Dict:
         """
         Analyze code and provide corrections, explanations, and examples.
         
@@ -48,11 +92,13 @@ class GPTService:
             code: The code to analyze
             language: Programming language
             explain_level: "short", "medium", or "long"
+            api_key: Optional key to use instead of the configured one
         
         Returns:
             Dict containing analysis results
         """
-        if not self.is_configured():
+        client = self._get_client(api_key)
+        if client is None:
             return {
                 'success': False,
                 'error': 'GPT service not configured. Please set OPENAI_API_KEY.'
@@ -62,8 +108,8 @@ class GPTService:
             # Create analysis prompt based on explain level
             prompt = self._create_analysis_prompt(code, language, explain_level)
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = client.chat.completions.create(
+                model=GPT_MODEL,
                 messages=[
                     {
                         "role": "system",
@@ -95,7 +141,8 @@ class GPTService:
                 'error': f'Analysis failed: {str(e)}'
             }
     
-    def generate_code(self, prompt: str, language: str, explain_level: str = "medium") -> Dict:
+    def generate_code(self, prompt: str, language: str, explain_level: str = "medium",
+                     api_key: Optional[str] = None) -> Dict:
         """
         Generate code based on user prompt.
         
@@ -103,11 +150,13 @@ class GPTService:
             prompt: User's code generation request
             language: Target programming language
             explain_level: Level of explanation detail
+            api_key: Optional key to use instead of the configured one
         
         Returns:
             Dict containing generated code and explanation
         """
-        if not self.is_configured():
+        client = self._get_client(api_key)
+        if client is None:
             return {
                 'success': False,
                 'error': 'GPT service not configured. Please set OPENAI_API_KEY.'
@@ -116,8 +165,8 @@ class GPTService:
         try:
             generation_prompt = self._create_generation_prompt(prompt, language, explain_level)
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            response = client.chat.completions.create(
+                model=GPT_MODEL,
                 messages=[
                     {
                         "role": "system",
@@ -226,53 +275,32 @@ Please provide your response in the following JSON format:
     
     def _parse_analysis_response(self, response_text: str, original_code: str, language: str) -> Dict:
         """Parse GPT analysis response into structured format."""
-        try:
-            # Try to extract JSON from the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                parsed = json.loads(json_str)
-                
-                # Add diff information if corrections exist
-                if parsed.get('corrections', {}).get('corrected_code'):
-                    parsed['corrections']['diff'] = self._generate_diff(
-                        original_code, 
-                        parsed['corrections']['corrected_code']
-                    )
-                
-                return parsed
-            else:
-                # Fallback: create structured response from text
-                return self._create_fallback_analysis(response_text, original_code)
-                
-        except json.JSONDecodeError:
+        # Try to extract JSON from the response
+        parsed = load_json_envelope(response_text)
+        if parsed is None:
             # Fallback: create structured response from text
             return self._create_fallback_analysis(response_text, original_code)
+        
+        # Add diff information if corrections exist
+        if parsed.get('corrections', {}).get('corrected_code'):
+            parsed['corrections']['diff'] = self._generate_diff(
+                original_code, 
+                parsed['corrections']['corrected_code']
+            )
+        
+        return parsed
     
     def _parse_generation_response(self, response_text: str, language: str) -> Dict:
         """Parse GPT generation response into structured format."""
-        try:
-            # Try to extract JSON from the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                # Fallback: create structured response from text
-                return self._create_fallback_generation(response_text)
-                
-        except json.JSONDecodeError:
+        # Try to extract JSON from the response
+        parsed = load_json_envelope(response_text)
+        if parsed is None:
             # Fallback: create structured response from text
             return self._create_fallback_generation(response_text)
+        return parsed
     
     def _generate_diff(self, original: str, corrected: str) -> List[Dict]:
         """Generate diff between original and corrected code."""
-        import difflib
-        
         original_lines = original.splitlines()
         corrected_lines = corrected.splitlines()
         
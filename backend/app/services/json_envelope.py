@@ -0,0 +1,78 @@
+"""
+JSON helpers shared by the AI provider services: fast (de)serialization and
+extraction of the JSON object a model embeds in its free-form response.
+"""
+
+import re
+import json
+from typing import Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Characters that matter when matching JSON braces: braces, string quotes, escapes
+_JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+# Candidate objects tried before giving up on a response
+_MAX_JSON_CANDIDATES = 8
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so one except clause covers both
+json_loads = orjson.loads if orjson is not None else json.loads
+
+def json_dumps(obj) -> bytes:
+    """Serialize to UTF-8 JSON bytes, with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+def extract_json_envelope(text: str, start: int = 0) -> Tuple[Optional[str], int]:
+    """
+    Find the first balanced {...} object at or after start, ignoring braces inside strings.
+
+    Returns:
+        Tuple of (object text or None, index of its opening brace or -1)
+    """
+    start = text.find('{', start)
+    if start == -1:
+        return None, -1
+
+    depth = 0
+    in_string = False
+    skip_pos = -1
+    for match in _JSON_TOKEN_RE.finditer(text, start):
+        pos = match.start()
+        if pos == skip_pos:
+            # Character escaped by the preceding backslash
+            continue
+        char = match.group()
+        if char == '\\':
+            skip_pos = pos + 1
+        elif char == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return text[start:pos + 1], start
+
+    return None, start
+
+def load_json_envelope(text: str) -> Optional[Dict]:
+    """Parse the first JSON object embedded in a model response, skipping stray braces in prose."""
+    start = 0
+    for _ in range(_MAX_JSON_CANDIDATES):
+        candidate, found_at = extract_json_envelope(text, start)
+        if found_at == -1:
+            return None
+        if candidate is not None:
+            try:
+                parsed = json_loads(candidate)
+                if isinstance(parsed, dict):
+                    return parsed
+            except json.JSONDecodeError:
+                pass
+        start = found_at + 1
+    return None
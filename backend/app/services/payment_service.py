@@ -2,9 +2,15 @@
 Payment service for handling subscription payments and integrations.
 """
 
-import stripe
-import razorpay
-from decimal import Decimal
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache
+from decimal import Decimal, ROUND_HALF_UP
+from dataclasses import dataclass, field
 from datetime import datetime, date, timedelta
 from typing import Optional, Dict, Any, List, Tuple
 from flask import current_app
@@ -15,186 +21,276 @@ from app.models.subscription import (
 from app.models.user import User
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# The plans listing is served from memory for this long. The cache is per gunicorn worker:
+# an admin edit clears only the worker that handled it, so the others may list the old
+# catalog until the TTL runs out. Pricing and checkout always read the plan row itself.
+PLANS_CACHE_TTL = 60.0
+_ACTIVE_PLANS_KEY = 'active_plans'
+_PLANS_PAYLOAD_KEY = 'plans_payload'
+
+# Keep-alive pool shared by the gateway SDKs so checkouts reuse TCP/TLS connections
+GATEWAY_POOL_SIZE = 32
+GATEWAY_TIMEOUT = 30
+# Retries for transient gateway failures (network errors, 429, 5xx). Rate limits are left to
+# the gateways' 429s: these back off and honour Retry-After. A client-side limit would be per
+# gunicorn worker, and the workers share one API account limit.
+GATEWAY_MAX_RETRIES = 2
+
+# Served when the plan table can't be read; built once since plans are only read
+_FALLBACK_PLANS = (
+    SubscriptionPlan(
+        id=1,
+        name="Basic",
+        description="Basic plan with limited features",
+        plan_type=PlanType.MONTHLY,
+        price_per_unit=Decimal('9.99'),
+        features={
+            "features": ["Code execution", "Basic support"]
+        }
+    ),
+    SubscriptionPlan(
+        id=2,
+        name="Premium",
+        description="Premium plan with all features",
+        plan_type=PlanType.MONTHLY,
+        price_per_unit=Decimal('19.99'),
+        features={
+            "features": ["Code execution", "AI analysis", "Priority support"]
+        }
+    ),
+    SubscriptionPlan(
+        id=3,
+        name="Annual",
+        description="Annual plan with discount",
+        plan_type=PlanType.YEARLY,
+        price_per_unit=Decimal('199.99'),
+        features={
+            "features": ["Code execution", "AI analysis", "Priority support", "Advanced features"]
+        }
+    )
+)
+
+_FALLBACK_PLANS_INDEXED = (_FALLBACK_PLANS, {int(plan.id): plan for plan in _FALLBACK_PLANS})
+
+# Gateway statuses that mean the money has been captured (Stripe, Razorpay)
+_PAID_STATUSES = frozenset({'succeeded', 'paid'})
+
+def _build_gateway_session() -> requests.Session:
+    """Create the pooled HTTP session handed to the Stripe and Razorpay clients."""
+    session = requests.Session()
+    # urllib3 retries connection failures for any method, but only resends idempotent
+    # methods (e.g. Razorpay's order fetch) after a read error or a 429/5xx answer
+    adapter = HTTPAdapter(
+        pool_connections=GATEWAY_POOL_SIZE,
+        pool_maxsize=GATEWAY_POOL_SIZE,
+        max_retries=Retry(
+            total=GATEWAY_MAX_RETRIES,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False
+        )
+    )
+    session.mount('https://', adapter)
+    return session
+
+def to_minor_units(amount: Decimal) -> int:
+    """Convert a currency amount to integer minor units (cents/paise), rounding half up."""
+    return int((amount * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+@dataclass(slots=True, frozen=True)
+class GatewayResult:
+    """Outcome of a payment gateway call."""
+    success: bool
+    status: Optional[str] = None
+    payment_intent_id: Optional[str] = None
+    client_secret: Optional[str] = None
+    order_id: Optional[str] = None
+    transaction_id: Optional[str] = None
+    refund_id: Optional[str] = None
+    error: Optional[str] = None
+    # Plain dict, never an SDK object, so payments don't hold on to client wrappers
+    gateway_response: Dict[str, Any] = field(default_factory=dict)
+
+def _gateway_error(error: Exception) -> GatewayResult:
+    """Failed GatewayResult carrying the gateway's error message."""
+    message = str(error)
+    return GatewayResult(success=False, error=message, gateway_response={'error': message})
+
 class PaymentGateway:
     """Base class for payment gateway integrations."""
     
-    def create_payment_intent(self, amount: Decimal, currency: str, 
-                            metadata: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Create a payment intent."""
+    __slots__ = ()
+    
+    def create_payment_intent(self, amount_minor: int, currency: str, 
+                            metadata: Dict[str, Any] = None) -> GatewayResult:
+        """Create a payment intent for amount_minor in the currency's smallest unit."""
         raise NotImplementedError
     
-    def confirm_payment(self, payment_intent_id: str) -> Dict[str, Any]:
+    def confirm_payment(self, payment_intent_id: str) -> GatewayResult:
         """Confirm a payment."""
         raise NotImplementedError
     
-    def refund_payment(self, transaction_id: str, amount: Decimal = None) -> Dict[str, Any]:
+    def refund_payment(self, transaction_id: str, amount_minor: int = None) -> GatewayResult:
         """Refund a payment."""
         raise NotImplementedError
 
 class StripeGateway(PaymentGateway):
     """Stripe payment gateway integration."""
     
-    def __init__(self, api_key: str):
+    # The Stripe SDK keeps its key and HTTP client at module level
+    __slots__ = ('_stripe', 'gateway_name')
+    
+    def __init__(self, api_key: str, session: requests.Session = None):
+        # Imported on first use so workers without Stripe configured never load the SDK
+        import stripe
+        self._stripe = stripe
         stripe.api_key = api_key
+        # The SDK retries connection errors, 409s and 5xx with jittered exponential backoff,
+        # attaching an idempotency key so a retried create can't double-charge
+        stripe.max_network_retries = GATEWAY_MAX_RETRIES
+        if session is not None:
+            stripe.default_http_client = stripe.http_client.RequestsClient(
+                timeout=GATEWAY_TIMEOUT,
+                session=session
+            )
         self.gateway_name = "stripe"
     
-    def create_payment_intent(self, amount: Decimal, currency: str, 
-                            metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+    def create_payment_intent(self, amount_minor: int, currency: str, 
+                            metadata: Dict[str, Any] = None) -> GatewayResult:
         """Create a Stripe payment intent."""
         try:
-            # Convert amount to cents (Stripe expects smallest currency unit)
-            amount_cents = int(amount * 100)
-            
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
+            intent = self._stripe.PaymentIntent.create(
+                amount=amount_minor,
                 currency=currency.lower(),
                 metadata=metadata or {},
                 automatic_payment_methods={'enabled': True}
             )
             
-            return {
-                'success': True,
-                'payment_intent_id': intent.id,
-                'client_secret': intent.client_secret,
-                'status': intent.status,
-                'gateway_response': intent
-            }
+            return GatewayResult(
+                success=True,
+                payment_intent_id=intent.id,
+                client_secret=intent.client_secret,
+                status=intent.status,
+                gateway_response=intent.to_dict_recursive()
+            )
             
-        except stripe.error.StripeError as e:
-            logger.error(f"Stripe error creating payment intent: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'gateway_response': {'error': str(e)}
-            }
+        except self._stripe.error.StripeError as e:
+            logger.error("Stripe error creating payment intent: %s", e)
+            return _gateway_error(e)
     
-    def confirm_payment(self, payment_intent_id: str) -> Dict[str, Any]:
+    def confirm_payment(self, payment_intent_id: str) -> GatewayResult:
         """Confirm a Stripe payment."""
         try:
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            intent = self._stripe.PaymentIntent.retrieve(payment_intent_id)
             
-            return {
-                'success': intent.status == 'succeeded',
-                'status': intent.status,
-                'transaction_id': intent.id,
-                'gateway_response': intent
-            }
+            return GatewayResult(
+                success=intent.status == 'succeeded',
+                status=intent.status,
+                transaction_id=intent.id,
+                gateway_response=intent.to_dict_recursive()
+            )
             
-        except stripe.error.StripeError as e:
-            logger.error(f"Stripe error confirming payment: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'gateway_response': {'error': str(e)}
-            }
+        except self._stripe.error.StripeError as e:
+            logger.error("Stripe error confirming payment: %s", e)
+            return _gateway_error(e)
     
-    def refund_payment(self, transaction_id: str, amount: Decimal = None) -> Dict[str, Any]:
+    def refund_payment(self, transaction_id: str, amount_minor: int = None) -> GatewayResult:
         """Refund a Stripe payment."""
         try:
             refund_data = {'payment_intent': transaction_id}
-            if amount:
-                refund_data['amount'] = int(amount * 100)
+            if amount_minor:
+                refund_data['amount'] = amount_minor
             
-            refund = stripe.Refund.create(**refund_data)
+            refund = self._stripe.Refund.create(**refund_data)
             
-            return {
-                'success': refund.status == 'succeeded',
-                'refund_id': refund.id,
-                'status': refund.status,
-                'gateway_response': refund
-            }
+            return GatewayResult(
+                success=refund.status == 'succeeded',
+                refund_id=refund.id,
+                status=refund.status,
+                gateway_response=refund.to_dict_recursive()
+            )
             
-        except stripe.error.StripeError as e:
-            logger.error(f"Stripe error processing refund: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'gateway_response': {'error': str(e)}
-            }
+        except self._stripe.error.StripeError as e:
+            logger.error("Stripe error processing refund: %s", e)
+            return _gateway_error(e)
 
 class RazorpayGateway(PaymentGateway):
     """Razorpay payment gateway integration."""
     
-    def __init__(self, key_id: str, key_secret: str):
-        self.client = razorpay.Client(auth=(key_id, key_secret))
+    __slots__ = ('client', 'gateway_name')
+    
+    def __init__(self, key_id: str, key_secret: str, session: requests.Session = None):
+        # Imported on first use so workers without Razorpay configured never load the SDK
+        import razorpay
+        self.client = razorpay.Client(session=session, auth=(key_id, key_secret))
         self.gateway_name = "razorpay"
     
-    def create_payment_intent(self, amount: Decimal, currency: str, 
-                            metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+    def create_payment_intent(self, amount_minor: int, currency: str, 
+                            metadata: Dict[str, Any] = None) -> GatewayResult:
         """Create a Razorpay order."""
         try:
-            # Convert amount to paise (Razorpay expects smallest currency unit)
-            amount_paise = int(amount * 100)
-            
             order_data = {
-                'amount': amount_paise,
+                'amount': amount_minor,
                 'currency': currency.upper(),
                 'notes': metadata or {}
             }
             
             order = self.client.order.create(data=order_data)
             
-            return {
-                'success': True,
-                'payment_intent_id': order['id'],
-                'order_id': order['id'],
-                'status': order['status'],
-                'gateway_response': order
-            }
+            return GatewayResult(
+                success=True,
+                payment_intent_id=order['id'],
+                order_id=order['id'],
+                status=order['status'],
+                gateway_response=order
+            )
             
         except Exception as e:
-            logger.error(f"Razorpay error creating order: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'gateway_response': {'error': str(e)}
-            }
+            logger.error("Razorpay error creating order: %s", e)
+            return _gateway_error(e)
     
-    def confirm_payment(self, payment_intent_id: str) -> Dict[str, Any]:
+    def confirm_payment(self, payment_intent_id: str) -> GatewayResult:
         """Confirm a Razorpay payment."""
         try:
             order = self.client.order.fetch(payment_intent_id)
             
-            return {
-                'success': order['status'] == 'paid',
-                'status': order['status'],
-                'transaction_id': payment_intent_id,
-                'gateway_response': order
-            }
+            return GatewayResult(
+                success=order['status'] == 'paid',
+                status=order['status'],
+                transaction_id=payment_intent_id,
+                gateway_response=order
+            )
             
         except Exception as e:
-            logger.error(f"Razorpay error confirming payment: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'gateway_response': {'error': str(e)}
-            }
+            logger.error("Razorpay error confirming payment: %s", e)
+            return _gateway_error(e)
     
-    def refund_payment(self, transaction_id: str, amount: Decimal = None) -> Dict[str, Any]:
+    def refund_payment(self, transaction_id: str, amount_minor: int = None) -> GatewayResult:
         """Refund a Razorpay payment."""
         try:
             refund_data = {}
-            if amount:
-                refund_data['amount'] = int(amount * 100)
+            if amount_minor:
+                refund_data['amount'] = amount_minor
             
             refund = self.client.payment.refund(transaction_id, refund_data)
             
-            return {
-                'success': refund['status'] == 'processed',
-                'refund_id': refund['id'],
-                'status': refund['status'],
-                'gateway_response': refund
-            }
+            return GatewayResult(
+                success=refund['status'] == 'processed',
+                refund_id=refund['id'],
+                status=refund['status'],
+                gateway_response=refund
+            )
             
         except Exception as e:
-            logger.error(f"Razorpay error processing refund: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'gateway_response': {'error': str(e)}
-            }
+            logger.error("Razorpay error processing refund: %s", e)
+            return _gateway_error(e)
 
 class PaymentService:
     """Service for handling subscription payments."""
@@ -202,13 +298,20 @@ class PaymentService:
     def __init__(self):
         self.gateways = {}
         self.default_gateway = None
+        # (plans, {plan.id: plan}) for the active catalog and its serialized API payload;
+        # TTLCache needs the lock
+        self._plans_cache: TTLCache = TTLCache(maxsize=2, ttl=PLANS_CACHE_TTL, timer=time.monotonic)
+        self._plans_cache_lock = threading.Lock()
     
     def initialize(self, app):
         """Initialize payment service with Flask app configuration."""
+        # One connection pool for every gateway
+        session = _build_gateway_session()
+        
         # Initialize Stripe
         stripe_key = app.config.get('STRIPE_SECRET_KEY')
         if stripe_key:
-            self.gateways['stripe'] = StripeGateway(stripe_key)
+            self.gateways['stripe'] = StripeGateway(stripe_key, session)
             if not self.default_gateway:
                 self.default_gateway = 'stripe'
         
@@ -216,7 +319,7 @@ class PaymentService:
         razorpay_key_id = app.config.get('RAZORPAY_KEY_ID')
         razorpay_key_secret = app.config.get('RAZORPAY_KEY_SECRET')
         if razorpay_key_id and razorpay_key_secret:
-            self.gateways['razorpay'] = RazorpayGateway(razorpay_key_id, razorpay_key_secret)
+            self.gateways['razorpay'] = RazorpayGateway(razorpay_key_id, razorpay_key_secret, session)
             if not self.default_gateway:
                 self.default_gateway = 'razorpay'
         
@@ -225,67 +328,105 @@ class PaymentService:
     
     def get_available_plans(self) -> List[SubscriptionPlan]:
         """Get all available subscription plans."""
+        return list(self._get_plans_indexed()[0])
+    
+    def get_plans_payload(self) -> bytes:
+        """JSON body for the plans endpoint, serialized once per catalog refresh."""
+        with self._plans_cache_lock:
+            cached = self._plans_cache.get(_PLANS_PAYLOAD_KEY)
+        if cached is not None:
+            return cached
+        
+        plans, _ = self._get_plans_indexed()
+        plans_data = []
+        for plan in plans:
+            plan_dict = plan.to_dict()
+            features = plan.features if isinstance(plan.features, dict) else {}
+            # Ensure ID is string for frontend compatibility
+            plan_dict['id'] = str(plan_dict['id'])
+            # Add additional fields for frontend compatibility
+            plan_type = plan_dict.get('plan_type', 'monthly')
+            if plan_type == 'yearly':
+                plan_dict['interval'] = 'year'
+            elif plan_type == 'monthly':
+                plan_dict['interval'] = 'month'
+            else:
+                plan_dict['interval'] = plan_type.replace('ly', '') if 'ly' in plan_type else plan_type
+            
+            plan_dict['price'] = float(plan_dict.get('price_per_unit', 0))
+            plan_dict['executionLimit'] = features.get('execution_limit', 100)
+            plan_dict['storageLimit'] = features.get('storage_limit', 1024)
+            plan_dict['features'] = features.get('features', [])
+            plans_data.append(plan_dict)
+        
+        body = {'success': True, 'plans': plans_data, 'count': len(plans_data)}
+        payload = orjson.dumps(body) if orjson is not None else json.dumps(body).encode('utf-8')
+        if plans:
+            with self._plans_cache_lock:
+                self._plans_cache[_PLANS_PAYLOAD_KEY] = payload
+        return payload
+    
+    def invalidate_plans_cache(self):
+        """Forget this worker's cached plan listing; call after creating, editing or removing plans."""
+        with self._plans_cache_lock:
+            self._plans_cache.clear()
+    
+    def _get_plans_indexed(self) -> Tuple[Tuple[SubscriptionPlan, ...], Dict[int, SubscriptionPlan]]:
+        """Return the active plans and an id -> plan index, cached for PLANS_CACHE_TTL seconds."""
+        with self._plans_cache_lock:
+            cached = self._plans_cache.get(_ACTIVE_PLANS_KEY)
+        if cached is not None:
+            return cached
+        
         try:
             from app.database.plan_repository import PlanRepository
-            return PlanRepository.get_all_plans(active_only=True)
+            plans = PlanRepository.get_all_plans(active_only=True)
         except Exception as e:
-            logger.error(f"Error fetching plans from database: {str(e)}")
-            # Fallback to mock data if database is not available
-            return [
-                SubscriptionPlan(
-                    id=1,
-                    name="Basic",
-                    description="Basic plan with limited features",
-                    plan_type=PlanType.MONTHLY,
-                    price_per_unit=Decimal('9.99'),
-                    features={
-                        "features": ["Code execution", "Basic support"]
-                    }
-                ),
-                SubscriptionPlan(
-                    id=2,
-                    name="Premium",
-                    description="Premium plan with all features",
-                    plan_type=PlanType.MONTHLY,
-                    price_per_unit=Decimal('19.99'),
-                    features={
-                        "features": ["Code execution", "AI analysis", "Priority support"]
-                    }
-                ),
-                SubscriptionPlan(
-                    id=3,
-                    name="Annual",
-                    description="Annual plan with discount",
-                    plan_type=PlanType.YEARLY,
-                    price_per_unit=Decimal('199.99'),
-                    features={
-                        "features": ["Code execution", "AI analysis", "Priority support", "Advanced features"]
-                    }
-                )
-            ]
+            logger.error("Error fetching plans from database: %s", e)
+            # Fallback to mock data if database is not available; not cached, so
+            # the database is retried on the next call
+            return _FALLBACK_PLANS_INDEXED
+        
+        # Ids are normalized to int here so lookups need a single probe
+        indexed = (tuple(plans), {int(plan.id): plan for plan in plans})
+        if plans:
+            # The repository returns [] on database errors; don't pin that for the TTL
+            with self._plans_cache_lock:
+                self._plans_cache[_ACTIVE_PLANS_KEY] = indexed
+        return indexed
+    
+    def _get_plan(self, plan_id: int) -> Optional[SubscriptionPlan]:
+        """Fetch a plan by primary key; never from the listing cache, which other workers may hold stale."""
+        try:
+            from app.database.plan_repository import PlanRepository
+            return PlanRepository.get_plan_by_id(plan_id)
+        except Exception as e:
+            logger.error("Error fetching plan %s from database: %s", plan_id, e)
+            return _FALLBACK_PLANS_INDEXED[1].get(plan_id)
     
     def calculate_subscription_cost(self, plan_id: int, start_date: date = None, 
-                                  end_date: date = None, duration_days: int = None) -> Tuple[bool, Decimal, str]:
+                                  end_date: date = None, duration_days: int = None
+                                  ) -> Tuple[bool, Decimal, Optional[SubscriptionPlan], str]:
         """
         Calculate the cost of a subscription.
         
         Returns:
-            Tuple of (success, total_cost, error_message)
+            Tuple of (success, total_cost, plan, error_message); plan is None on failure
         """
         try:
-            # Get plan (in real implementation, fetch from database)
-            plans = {plan.id: plan for plan in self.get_available_plans()}
-            plan = plans.get(plan_id)
-            
-            # Also try string version of plan_id for compatibility
-            if not plan:
-                plan = plans.get(str(plan_id))
+            plan_id = int(plan_id)
+        except (TypeError, ValueError):
+            return False, Decimal('0'), None, "Invalid plan id"
+        
+        try:
+            plan = self._get_plan(plan_id)
             
             if not plan:
-                return False, Decimal('0'), f"Plan not found. Available plan IDs: {list(plans.keys())}"
+                _, plans = self._get_plans_indexed()
+                return False, Decimal('0'), None, f"Plan not found. Available plan IDs: {list(plans.keys())}"
             
             if not plan.is_active:
-                return False, Decimal('0'), "Plan is not available"
+                return False, Decimal('0'), None, "Plan is not available"
             
             # Calculate duration and cost
             if plan.plan_type == PlanType.CUSTOM:
@@ -295,15 +436,15 @@ class PaymentService:
                     duration_days = (end_date - start_date).days + 1
                     cost = plan.calculate_price(duration_days)
                 else:
-                    return False, Decimal('0'), "Duration or dates required for custom plan"
+                    return False, Decimal('0'), None, "Duration or dates required for custom plan"
             else:
                 cost = plan.calculate_price()
             
-            return True, cost, ""
+            return True, cost, plan, ""
             
         except Exception as e:
-            logger.error(f"Error calculating subscription cost: {str(e)}")
-            return False, Decimal('0'), f"Cost calculation failed: {str(e)}"
+            logger.error("Error calculating subscription cost: %s", e)
+            return False, Decimal('0'), None, f"Cost calculation failed: {str(e)}"
     
     def create_subscription_payment(self, user: User, plan_id: int, 
                                   start_date: date = None, end_date: date = None,
@@ -316,7 +457,7 @@ class PaymentService:
         """
         try:
             # Calculate cost
-            success, total_cost, error = self.calculate_subscription_cost(
+            success, total_cost, plan, error = self.calculate_subscription_cost(
                 plan_id, start_date, end_date, duration_days
             )
             if not success:
@@ -330,9 +471,6 @@ class PaymentService:
             payment_gateway = self.gateways[gateway_name]
             
             # Create subscription record (in real implementation, save to database)
-            plans = {plan.id: plan for plan in self.get_available_plans()}
-            plan = plans.get(plan_id) or plans.get(str(plan_id))
-            
             subscription = UserSubscription.create_subscription(
                 user_id=user.id,
                 plan=plan,
@@ -358,17 +496,17 @@ class PaymentService:
             }
             
             gateway_result = payment_gateway.create_payment_intent(
-                amount=total_cost,
+                amount_minor=to_minor_units(total_cost),
                 currency="USD",
                 metadata=metadata
             )
             
-            if not gateway_result['success']:
-                return False, None, f"Payment gateway error: {gateway_result.get('error', 'Unknown error')}"
+            if not gateway_result.success:
+                return False, None, f"Payment gateway error: {gateway_result.error or 'Unknown error'}"
             
             # Update payment with gateway response
-            payment.gateway_payment_intent_id = gateway_result['payment_intent_id']
-            payment.gateway_response = gateway_result.get('gateway_response', {})
+            payment.gateway_payment_intent_id = gateway_result.payment_intent_id
+            payment.gateway_response = gateway_result.gateway_response
             
             # In real implementation, save payment and subscription to database
             
@@ -376,20 +514,25 @@ class PaymentService:
                 'subscription': subscription.to_dict(),
                 'payment': payment.to_dict(),
                 'gateway_data': {
-                    'payment_intent_id': gateway_result['payment_intent_id'],
-                    'client_secret': gateway_result.get('client_secret'),
+                    'payment_intent_id': gateway_result.payment_intent_id,
+                    'client_secret': gateway_result.client_secret,
                     'gateway': gateway_name
                 }
             }, ""
             
         except Exception as e:
-            logger.error(f"Error creating subscription payment: {str(e)}")
+            logger.error("Error creating subscription payment: %s", e)
             return False, None, f"Payment creation failed: {str(e)}"
     
-    def confirm_payment(self, payment_id: int, gateway_transaction_id: str = None) -> Tuple[bool, str]:
+    def confirm_payment(self, payment_id: int, gateway_transaction_id: str = None,
+                        known_status: str = None) -> Tuple[bool, str]:
         """
         Confirm a payment and activate subscription.
         
+        known_status is the gateway status from an already verified source such as
+        a signed webhook event. When it is a paid status and gateway_transaction_id
+        is given, the gateway is not queried again.
+        
         Returns:
             Tuple of (success, message)
         """
@@ -408,14 +551,22 @@ class PaymentService:
             if not gateway:
                 return False, "Payment gateway not available"
             
-            # Confirm with gateway
-            gateway_result = gateway.confirm_payment(payment.gateway_payment_intent_id)
+            if known_status in _PAID_STATUSES and gateway_transaction_id:
+                # The caller already holds the terminal status; skip the retrieve round-trip
+                gateway_result = GatewayResult(
+                    success=True,
+                    status=known_status,
+                    transaction_id=gateway_transaction_id
+                )
+            else:
+                # Confirm with gateway
+                gateway_result = gateway.confirm_payment(payment.gateway_payment_intent_id)
             
-            if gateway_result['success']:
+            if gateway_result.success:
                 # Mark payment as completed
                 payment.mark_completed(
-                    gateway_transaction_id or gateway_result['transaction_id'],
-                    gateway_result.get('gateway_response', {})
+                    gateway_transaction_id or gateway_result.transaction_id,
+                    gateway_result.gateway_response
                 )
                 
                 # Activate subscription
@@ -427,21 +578,21 @@ class PaymentService:
                 
                 # In real implementation, save changes to database
                 
-                logger.info(f"Payment confirmed successfully: {payment_id}")
+                logger.info("Payment confirmed successfully: %s", payment_id)
                 return True, "Payment confirmed and subscription activated"
             else:
                 # Mark payment as failed
                 payment.mark_failed(
-                    gateway_result.get('error', 'Payment confirmation failed'),
-                    gateway_result.get('gateway_response', {})
+                    gateway_result.error or 'Payment confirmation failed',
+                    gateway_result.gateway_response
                 )
                 
                 # In real implementation, save changes to database
                 
-                return False, f"Payment confirmation failed: {gateway_result.get('error', 'Unknown error')}"
+                return False, f"Payment confirmation failed: {gateway_result.error or 'Unknown error'}"
             
         except Exception as e:
-            logger.error(f"Error confirming payment: {str(e)}")
+            logger.error("Error confirming payment: %s", e)
             return False, f"Payment confirmation failed: {str(e)}"
     
     def get_user_subscriptions(self, user_id: int) -> List[UserSubscription]:
@@ -451,11 +602,12 @@ class PaymentService:
     
     def get_active_subscription(self, user_id: int) -> Optional[UserSubscription]:
         """Get the active subscription for a user."""
-        subscriptions = self.get_user_subscriptions(user_id)
-        for subscription in subscriptions:
-            if subscription.is_active():
-                return subscription
-        return None
+        try:
+            from app.database.subscription_repository import SubscriptionRepository
+            return SubscriptionRepository.get_active_for_user(user_id)
+        except Exception as e:
+            logger.error("Error fetching active subscription for user %s: %s", user_id, e)
+            return None
     
     def cancel_subscription(self, subscription_id: int, reason: str = None) -> Tuple[bool, str]:
         """
@@ -479,11 +631,11 @@ class PaymentService:
             
             # In real implementation, save changes to database
             
-            logger.info(f"Subscription cancelled: {subscription_id}")
+            logger.info("Subscription cancelled: %s", subscription_id)
             return True, "Subscription cancelled successfully"
             
         except Exception as e:
-            logger.error(f"Error cancelling subscription: {str(e)}")
+            logger.error("Error cancelling subscription: %s", e)
             return False, f"Subscription cancellation failed: {str(e)}"
     
     def extend_subscription(self, subscription_id: int, days: int) -> Tuple[bool, str]:
@@ -505,11 +657,11 @@ class PaymentService:
             
             # In real implementation, save changes to database
             
-            logger.info(f"Subscription extended: {subscription_id} by {days} days")
+            logger.info("Subscription extended: %s by %s days", subscription_id, days)
             return True, f"Subscription extended by {days} days"
             
         except Exception as e:
-            logger.error(f"Error extending subscription: {str(e)}")
+            logger.error("Error extending subscription: %s", e)
             return False, f"Subscription extension failed: {str(e)}"
     
     def process_refund(self, payment_id: int, amount: Decimal = None, reason: str = None) -> Tuple[bool, str]:
@@ -537,24 +689,24 @@ class PaymentService:
             # Process refund with gateway
             gateway_result = gateway.refund_payment(
                 payment.gateway_transaction_id,
-                amount
+                to_minor_units(amount) if amount else None
             )
             
-            if gateway_result['success']:
+            if gateway_result.success:
                 # Update payment status
                 payment.status = PaymentStatus.REFUNDED
-                payment.gateway_response = gateway_result.get('gateway_response', {})
+                payment.gateway_response = gateway_result.gateway_response
                 payment.updated_at = datetime.utcnow()
                 
                 # In real implementation, save changes to database
                 
-                logger.info(f"Refund processed successfully: {payment_id}")
+                logger.info("Refund processed successfully: %s", payment_id)
                 return True, "Refund processed successfully"
             else:
-                return False, f"Refund failed: {gateway_result.get('error', 'Unknown error')}"
+                return False, f"Refund failed: {gateway_result.error or 'Unknown error'}"
             
         except Exception as e:
-            logger.error(f"Error processing refund: {str(e)}")
+            logger.error("Error processing refund: %s", e)
             return False, f"Refund processing failed: {str(e)}"
 
 # Global payment service instance
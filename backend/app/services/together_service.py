@@ -6,16 +6,133 @@ This is a fallback implementation that doesn't require the together package.
 import os
 import logging
 import json
-from typing import Dict, List, Optional
+import difflib
+from typing import Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import current_app
+from .json_envelope import json_dumps, json_loads, load_json_envelope
 
 logger = logging.getLogger(__name__)
 
+TOGETHER_MODEL = "meta-llama/Llama-3-8b-chat-hf"
+
+# Keep-alive pool for api.together.xyz so completions reuse TCP/TLS connections
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = 20
+HTTP_MAX_RETRIES = 2
+
+def _body_prefix(system_prompt: str) -> bytes:
+    """Serialize the static part of a chat request, open after the system message."""
+    body = json.dumps({
+        "model": TOGETHER_MODEL,
+        "max_tokens": 2000,
+        "temperature": 0.3,
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
+            }
+        ]
+    }).encode('utf-8')
+    # Drop the closing "]}" so the user message can be appended
+    return body[:-2]
+
+def _build_request_body(prefix: bytes, user_prompt: str) -> bytes:
+    """Append the user message to a prebuilt request prefix; only the prompt is serialized per call."""
+    return prefix + b',{"role": "user", "content": ' + json_dumps(user_prompt) + b'}]}'
+
+ANALYSIS_SYSTEM_PROMPT = "You are an expert code analyzer and teacher. Provide detailed, accurate code analysis with corrections, explanations, and real-world examples."
+
+_ANALYSIS_BODY_PREFIX = _body_prefix(ANALYSIS_SYSTEM_PROMPT)
+_GENERATION_BODY_PREFIX = _body_prefix("You are an expert programmer. Generate clean, efficient, well-documented code with detailed explanations.")
+
+# Prompt text that never varies goes first, so every request shares the longest possible
+# prefix (with the system message) and can hit provider-side prompt caching
+_ANALYSIS_PROMPT_PREFIX = """
+Analyze the code given at the end of this message and provide a structured response.
+
+Please provide your analysis in the following JSON format:
+{
+    "corrections": {
+        "has_issues": boolean,
+        "issues": [
+            {
+                "line": number,
+                "type": "syntax|logic|style|performance|security",
+                "description": "Issue description",
+                "suggestion": "How to fix it"
+            }
+        ],
+        "corrected_code": "The corrected version of the code"
+    },
+    "line_by_line_explanation": [
+        {
+            "line": number,
+            "code": "actual line of code",
+            "explanation": "What this line does"
+        }
+    ],
+    "overall_explanation": "Overall explanation of what the code does",
+    "real_world_example": "A practical real-world scenario where this code would be useful"
+}
+"""
+
+_GENERATION_PROMPT_PREFIX = """
+Generate code for the request given at the end of this message.
+
+Please provide your response in the following JSON format:
+{
+    "generated_code": "The complete, working code",
+    "explanation": "Explanation of how the code works",
+    "line_by_line_explanation": [
+        {
+            "line": number,
+            "code": "actual line of code",
+            "explanation": "What this line does"
+        }
+    ],
+    "usage_example": "How to use this code with sample input/output",
+    "best_practices": ["List of best practices demonstrated in the code"]
+}
+"""
+
+_ANALYSIS_DETAIL = {
+    'short': "\nKeep explanations concise and focus on key points only.",
+    'medium': "\nProvide balanced explanations with good detail but not overwhelming.",
+    'long': "\nProvide detailed explanations with examples, best practices, and additional context."
+}
+
+_GENERATION_DETAIL = {
+    'short': "\nKeep explanations brief and to the point.",
+    'medium': "\nProvide clear, moderately detailed explanations.",
+    'long': "\nProvide comprehensive explanations with detailed examples and context."
+}
+
+def _build_http_session() -> requests.Session:
+    """Create the pooled HTTP session used for Together AI requests."""
+    session = requests.Session()
+    session.headers['Content-Type'] = 'application/json'
+    # Completions are POSTs, so urllib3 only retries failed connections, never a sent request
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=Retry(
+            total=HTTP_MAX_RETRIES,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False
+        )
+    )
+    session.mount('https://', adapter)
+    return session
+
 class TogetherService:
     def __init__(self):
         self.api_key = None
         self.base_url = "https://api.together.xyz/v1"
+        self._session = _build_http_session()
         self._initialize_client()
     
     def _initialize_client(self):
@@ -30,9 +147,11 @@ class TogetherService:
         """Check if Together AI service is properly configured."""
         return self.api_key is not None
     
-    def analyze_code(self, code: str, language: str, explain_level: str = "medium") -> Dict:
+    def analyze_code(self, code: str, language: str, explain_level: str = "medium",
+                    api_key: Optional[str] = None) -> Dict:
         """Analyze code using Together AI API."""
-        if not self.is_configured():
+        api_key = api_key or self.api_key
+        if not api_key:
             return {
                 'success': False,
                 'error': 'Together AI service not configured. Please set TOGETHER_API_KEY.'
@@ -41,38 +160,19 @@ class TogetherService:
         try:
             prompt = self._create_analysis_prompt(code, language, explain_level)
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            headers = {"Authorization": f"Bearer {api_key}"}
             
-            payload = {
-                "model": "meta-llama/Llama-3-8b-chat-hf",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are an expert code analyzer and teacher. Provide detailed, accurate code analysis with corrections, explanations, and real-world examples."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 2000,
-                "temperature": 0.3
-            }
-            
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
-                json=payload,
+                data=_build_request_body(_ANALYSIS_BODY_PREFIX, prompt),
                 timeout=30
             )
             
             if response.status_code != 200:
                 raise Exception(f"API request failed with status {response.status_code}: {response.text}")
             
-            response_data = response.json()
+            response_data = json_loads(response.content)
             analysis_text = response_data["choices"][0]["message"]["content"]
             
             # Parse the structured response
@@ -90,9 +190,11 @@ class TogetherService:
                 'error': f'Analysis failed: {str(e)}'
             }
     
-    def generate_code(self, prompt: str, language: str, explain_level: str = "medium") -> Dict:
+    def generate_code(self, prompt: str, language: str, explain_level: str = "medium",
+                     api_key: Optional[str] = None) -> Dict:
         """Generate code using Together AI API."""
-        if not self.is_configured():
+        api_key = api_key or self.api_key
+        if not api_key:
             return {
                 'success': False,
                 'error': 'Together AI service not configured. Please set TOGETHER_API_KEY.'
@@ -101,38 +203,19 @@ class TogetherService:
         try:
             generation_prompt = self._create_generation_prompt(prompt, language, explain_level)
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": "meta-llama/Llama-3-8b-chat-hf",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are an expert programmer. Generate clean, efficient, well-documented code with detailed explanations."
-                    },
-                    {
-                        "role": "user",
-                        "content": generation_prompt
-                    }
-                ],
-                "max_tokens": 2000,
-                "temperature": 0.3
-            }
+            headers = {"Authorization": f"Bearer {api_key}"}
             
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
-                json=payload,
+                data=_build_request_body(_GENERATION_BODY_PREFIX, generation_prompt),
                 timeout=30
             )
             
             if response.status_code != 200:
                 raise Exception(f"API request failed with status {response.status_code}: {response.text}")
             
-            response_data = response.json()
+            response_data = json_loads(response.content)
             generation_text = response_data["choices"][0]["message"]["content"]
             
             # Parse the structured response
@@ -152,141 +235,68 @@ class TogetherService:
     
     def _create_analysis_prompt(self, code: str, language: str, explain_level: str) -> str:
         """Create analysis prompt based on explain level."""
-        base_prompt = f"""
-Analyze this {language} code and provide a structured response:
+        detail = _ANALYSIS_DETAIL.get(explain_level, _ANALYSIS_DETAIL['medium'])
+        return f"""{_ANALYSIS_PROMPT_PREFIX}{detail}
 
-CODE:
+CODE TO ANALYZE ({language}):
 ```{language}
 {code}
 ```
-
-Please provide your analysis in the following JSON format:
-{{
-    "corrections": {{
-        "has_issues": boolean,
-        "issues": [
-            {{
-                "line": number,
-                "type": "syntax|logic|style|performance|security",
-                "description": "Issue description",
-                "suggestion": "How to fix it"
-            }}
-        ],
-        "corrected_code": "The corrected version of the code"
-    }},
-    "line_by_line_explanation": [
-        {{
-            "line": number,
-            "code": "actual line of code",
-            "explanation": "What this line does"
-        }}
-    ],
-    "overall_explanation": "Overall explanation of what the code does",
-    "real_world_example": "A practical real-world scenario where this code would be useful"
-}}
 """
-        
-        if explain_level == "short":
-            base_prompt += "\nKeep explanations concise and focus on key points only."
-        elif explain_level == "long":
-            base_prompt += "\nProvide detailed explanations with examples, best practices, and additional context."
-        else:  # medium
-            base_prompt += "\nProvide balanced explanations with good detail but not overwhelming."
-        
-        return base_prompt
     
     def _create_generation_prompt(self, prompt: str, language: str, explain_level: str) -> str:
         """Create code generation prompt."""
-        base_prompt = f"""
-Generate {language} code based on this request: "{prompt}"
+        detail = _GENERATION_DETAIL.get(explain_level, _GENERATION_DETAIL['medium'])
+        return f"""{_GENERATION_PROMPT_PREFIX}{detail}
 
-Please provide your response in the following JSON format:
-{{
-    "generated_code": "The complete, working code",
-    "explanation": "Explanation of how the code works",
-    "line_by_line_explanation": [
-        {{
-            "line": number,
-            "code": "actual line of code",
-            "explanation": "What this line does"
-        }}
-    ],
-    "usage_example": "How to use this code with sample input/output",
-    "best_practices": ["List of best practices demonstrated in the code"]
-}}
+Generate {language} code based on this request: "{prompt}"
 """
-        
-        if explain_level == "short":
-            base_prompt += "\nKeep explanations brief and to the point."
-        elif explain_level == "long":
-            base_prompt += "\nProvide comprehensive explanations with detailed examples and context."
-        else:  # medium
-            base_prompt += "\nProvide clear, moderately detailed explanations."
-        
-        return base_prompt
     
     def _parse_analysis_response(self, response_text: str, original_code: str, language: str) -> Dict:
         """Parse Together AI analysis response into structured format."""
-        try:
-            # Try to extract JSON from the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                parsed = json.loads(json_str)
-                
-                # Add diff information if corrections exist
-                if parsed.get('corrections', {}).get('corrected_code'):
-                    parsed['corrections']['diff'] = self._generate_diff(
-                        original_code, 
-                        parsed['corrections']['corrected_code']
-                    )
-                
-                return parsed
-            else:
-                # Fallback: create structured response from text
-                return self._create_fallback_analysis(response_text, original_code)
-                
-        except json.JSONDecodeError:
+        # Try to extract JSON from the response
+        parsed = load_json_envelope(response_text)
+        if parsed is None:
             # Fallback: create structured response from text
             return self._create_fallback_analysis(response_text, original_code)
+        
+        # Add diff information if corrections exist
+        if parsed.get('corrections', {}).get('corrected_code'):
+            parsed['corrections']['diff'] = self._generate_diff(
+                original_code, 
+                parsed['corrections']['corrected_code']
+            )
+        
+        return parsed
     
     def _parse_generation_response(self, response_text: str, language: str) -> Dict:
         """Parse Together AI generation response into structured format."""
-        try:
-            # Try to extract JSON from the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                # Fallback: create structured response from text
-                return self._create_fallback_generation(response_text)
-                
-        except json.JSONDecodeError:
+        # Try to extract JSON from the response
+        parsed = load_json_envelope(response_text)
+        if parsed is None:
             # Fallback: create structured response from text
             return self._create_fallback_generation(response_text)
+        return parsed
     
     def _generate_diff(self, original: str, corrected: str) -> List[Dict]:
         """Generate diff between original and corrected code."""
-        import difflib
+        if original == corrected:
+            return []
         
         original_lines = original.splitlines()
         corrected_lines = corrected.splitlines()
         
+        # Same hunks as unified_diff (3 lines of context), built from the line ranges
+        # directly instead of formatting and re-parsing "+"/"-" prefixed text
+        matcher = difflib.SequenceMatcher(None, original_lines, corrected_lines)
         diff = []
-        for line in difflib.unified_diff(original_lines, corrected_lines, lineterm=''):
-            if line.startswith('@@'):
-                continue
-            elif line.startswith('-'):
-                diff.append({'type': 'removed', 'content': line[1:]})
-            elif line.startswith('+'):
-                diff.append({'type': 'added', 'content': line[1:]})
-            else:
-                diff.append({'type': 'unchanged', 'content': line})
+        for group in matcher.get_grouped_opcodes(3):
+            for tag, i1, i2, j1, j2 in group:
+                if tag == 'equal':
+                    diff.extend({'type': 'unchanged', 'content': line} for line in original_lines[i1:i2])
+                    continue
+                diff.extend({'type': 'removed', 'content': line} for line in original_lines[i1:i2])
+                diff.extend({'type': 'added', 'content': line} for line in corrected_lines[j1:j2])
         
         return diff
     
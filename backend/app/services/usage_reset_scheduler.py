@@ -1,26 +1,35 @@
 """
-Scheduler for resetting all user daily usage counts at midnight IST.
+Scheduler for pruning old daily usage rows at midnight IST.
+
+Usage rows are keyed by date, so a new day starts from zero without touching
+existing rows; the nightly job only deletes rows past the retention window.
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from pytz import timezone
-from datetime import datetime, time as dt_time
+from datetime import datetime, timedelta, time as dt_time
 from app.database.usage_repository import UsageRepository
 import logging
 
 logger = logging.getLogger(__name__)
 
-def reset_usage_job():
-    UsageRepository.reset_all_usage()
-    logger.info(f"Daily usage reset at {datetime.now(timezone('Asia/Kolkata'))}")
+IST = timezone('Asia/Kolkata')
+
+# Days of daily usage history kept before the nightly prune removes it
+USAGE_RETENTION_DAYS = 30
+
+def prune_usage_job():
+    cutoff_date = (datetime.now().date() - timedelta(days=USAGE_RETENTION_DAYS)).isoformat()
+    UsageRepository.prune_usage_before(cutoff_date)
+    logger.info(f"Daily usage prune at {datetime.now(IST)}")
 
-scheduler = BackgroundScheduler(timezone=timezone('Asia/Kolkata'))
+scheduler = BackgroundScheduler(timezone=IST)
 scheduler.add_job(
-    reset_usage_job,
+    prune_usage_job,
     'cron',
     hour=0,
     minute=0,
-    id='daily_usage_reset',
+    id='daily_usage_prune',
     replace_existing=True
 )
 scheduler.start()
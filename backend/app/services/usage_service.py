@@ -3,61 +3,112 @@ Usage tracking service for managing free trials and premium features.
 """
 
 import os
-import json
+import time
+import uuid
 import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple
-from flask import session
+from flask import g, has_request_context, session
 import pytz
 
 logger = logging.getLogger(__name__)
 
+# Daily free-trial limits reset at midnight IST
+IST = pytz.timezone('Asia/Kolkata')
+
+# Use /tmp for usage data since the filesystem is read-only
+USAGE_DB_PATH = '/tmp/usage_data.db'
+
+# One row per browser session; the primary key makes every per-session read an index lookup
+_USAGE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS session_usage (
+        session_id TEXT PRIMARY KEY,
+        analysis_count INTEGER NOT NULL DEFAULT 0,
+        generation_count INTEGER NOT NULL DEFAULT 0,
+        is_premium INTEGER NOT NULL DEFAULT 0,
+        first_use TEXT,
+        last_use TEXT,
+        last_reset_date TEXT,
+        premium_since TEXT,
+        reset_date TEXT
+    ) WITHOUT ROWID
+'''
+
+# Usage counters that _record_usage may increment (interpolated into SQL, so never caller input)
+_USAGE_COUNTERS = frozenset({'analysis_count', 'generation_count'})
+
 class UsageService:
     def __init__(self):
         self.free_trial_limit = 5
-        # Use /tmp for usage data since the filesystem is read-only
-        self.usage_file = '/tmp/usage_data.json'
-        self._ensure_usage_file()
+        self.usage_db = USAGE_DB_PATH
+        # Per-thread connections; SQLite serializes writes across threads and gunicorn workers
+        self._local = threading.local()
+        # (IST date string, epoch time of the next IST midnight when it goes stale)
+        self._ist_date_cache: Tuple[str, float] = ('', 0.0)
+        self._ensure_usage_db()
     
-    def _ensure_usage_file(self):
-        """Ensure usage data file exists."""
-        if not os.path.exists(self.usage_file):
-            try:
-                with open(self.usage_file, 'w') as f:
-                    json.dump({}, f)
-                logger.info(f"Created usage data file: {self.usage_file}")
-            except Exception as e:
-                logger.error(f"Failed to create usage file: {e}")
-    
-    def _load_usage_data(self) -> Dict:
-        """Load usage data from file."""
+    def _ensure_usage_db(self):
+        """Ensure the usage table exists."""
         try:
-            with open(self.usage_file, 'r') as f:
-                return json.load(f)
+            # Throwaway connection: this runs at import, before gunicorn forks its workers,
+            # and a cached connection must never be carried across fork()
+            conn = sqlite3.connect(self.usage_db, timeout=10)
+            try:
+                with conn:
+                    conn.execute(_USAGE_TABLE_SQL)
+            finally:
+                conn.close()
+            logger.info(f"Usage database ready: {self.usage_db}")
         except Exception as e:
-            logger.error(f"Failed to load usage data: {e}")
-            return {}
+            logger.error(f"Failed to create usage database: {e}")
     
-    def _save_usage_data(self, data: Dict):
-        """Save usage data to file."""
+    def _get_connection(self) -> sqlite3.Connection:
+        """Return this thread's usage database connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited through fork() belongs to the parent process; open a new one
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.usage_db, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    @contextmanager
+    def _connection(self):
+        """Yield this thread's connection in a transaction, discarding it after SQLite errors."""
+        conn = self._get_connection()
         try:
-            with open(self.usage_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save usage data: {e}")
+            with conn:
+                yield conn
+        except sqlite3.Error:
+            # Drop the cached connection so the next caller reopens a fresh one
+            self._local.conn = None
+            conn.close()
+            raise
     
     def get_session_id(self) -> str:
         """Get or create session ID."""
         if 'session_id' not in session:
-            import uuid
-            session['session_id'] = str(uuid.uuid4())
+            # 32 hex chars without dashes: a shorter cookie value and primary key
+            session['session_id'] = uuid.uuid4().hex
         return session['session_id']
     
     def _get_ist_date(self) -> str:
         """Get current date in IST timezone (YYYY-MM-DD format)."""
-        ist = pytz.timezone('Asia/Kolkata')
-        now_ist = datetime.now(ist)
-        return now_ist.strftime('%Y-%m-%d')
+        date_str, expires_at = self._ist_date_cache
+        if time.time() < expires_at:
+            return date_str
+        
+        now_ist = datetime.now(IST)
+        next_midnight = now_ist.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        date_str = now_ist.strftime('%Y-%m-%d')
+        self._ist_date_cache = (date_str, next_midnight.timestamp())
+        return date_str
     
     def _should_reset_daily_usage(self, user_data: Dict) -> bool:
         """Check if daily usage should be reset based on IST timezone."""
@@ -77,48 +128,126 @@ class UsageService:
         user_data['last_reset_date'] = current_date
         return user_data
 
-    def get_usage_info(self, session_id: Optional[str] = None) -> Dict:
-        """Get usage information for a session."""
-        if not session_id:
-            session_id = self.get_session_id()
-        
-        usage_data = self._load_usage_data()
-        user_data = usage_data.get(session_id, {
+    def _new_user_data(self) -> Dict:
+        """Usage data for a session that has no row yet."""
+        return {
             'analysis_count': 0,
             'generation_count': 0,
             'first_use': datetime.now().isoformat(),
             'is_premium': False,
             'last_reset_date': self._get_ist_date()
-        })
+        }
+    
+    def _get_user_data(self, conn: sqlite3.Connection, session_id: str) -> Dict:
+        """Fetch a session's usage row, applying and persisting the daily reset."""
+        row = conn.execute(
+            'SELECT * FROM session_usage WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            return self._new_user_data()
+        
+        user_data = dict(row)
+        user_data['is_premium'] = bool(user_data['is_premium'])
         
         # Check if we need to reset daily usage
         if self._should_reset_daily_usage(user_data):
             user_data = self._reset_daily_usage(user_data)
-            usage_data[session_id] = user_data
-            self._save_usage_data(usage_data)
+            conn.execute('''
+                UPDATE session_usage
+                SET analysis_count = 0, generation_count = 0, last_reset_date = ?
+                WHERE session_id = ?
+            ''', (user_data['last_reset_date'], session_id))
+        
+        return user_data
+    
+    def _insert_session(self, conn: sqlite3.Connection, session_id: str):
+        """Create the session's usage row if it doesn't exist yet."""
+        user_data = self._new_user_data()
+        conn.execute('''
+            INSERT OR IGNORE INTO session_usage (session_id, first_use, last_reset_date)
+            VALUES (?, ?, ?)
+        ''', (session_id, user_data['first_use'], user_data['last_reset_date']))
+    
+    def _get_request_usage_info(self, session_id: str) -> Optional[Dict]:
+        """Return usage info already computed for this session during the current request."""
+        if not has_request_context():
+            return None
+        cached = g.get('_usage_info')
+        if cached is not None and cached[0] == session_id:
+            return dict(cached[1])
+        return None
+    
+    def _set_request_usage_info(self, session_id: str, usage_info: Optional[Dict]):
+        """Remember (or with None, forget) usage info for the rest of the current request."""
+        if has_request_context():
+            g._usage_info = (session_id, dict(usage_info)) if usage_info is not None else None
+    
+    def _record_usage(self, session_id: str, counter: str) -> bool:
+        """Increment a usage counter if the session still has uses left."""
+        if counter not in _USAGE_COUNTERS:
+            raise ValueError(f"Unknown usage counter: {counter}")
+        
+        self._set_request_usage_info(session_id, None)
+        try:
+            with self._connection() as conn:
+                self._insert_session(conn, session_id)
+                self._get_user_data(conn, session_id)
+                # Limit check and increment in one statement, so concurrent requests can't overshoot
+                cursor = conn.execute(f'''
+                    UPDATE session_usage
+                    SET {counter} = {counter} + 1, last_use = ?
+                    WHERE session_id = ?
+                      AND (is_premium = 1 OR analysis_count + generation_count < ?)
+                ''', (datetime.now().isoformat(), session_id, self.free_trial_limit))
+                return cursor.rowcount == 1
+        except Exception as e:
+            # Don't block the user on a storage failure
+            logger.error(f"Failed to record usage: {e}")
+            return True
+
+    def get_usage_info(self, session_id: Optional[str] = None) -> Dict:
+        """Get usage information for a session."""
+        if not session_id:
+            session_id = self.get_session_id()
+        
+        usage_info = self._get_request_usage_info(session_id)
+        if usage_info is not None:
+            return usage_info
+        
+        try:
+            with self._connection() as conn:
+                user_data = self._get_user_data(conn, session_id)
+        except Exception as e:
+            logger.error(f"Failed to load usage data: {e}")
+            user_data = self._new_user_data()
         
         total_usage = user_data['analysis_count'] + user_data['generation_count']
         remaining_free = max(0, self.free_trial_limit - total_usage)
+        is_premium = user_data.get('is_premium', False)
         
-        # Calculate time until next reset (12:00 AM IST)
-        ist = pytz.timezone('Asia/Kolkata')
-        now_ist = datetime.now(ist)
-        next_reset = now_ist.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        time_until_reset = next_reset - now_ist
-        
-        return {
+        usage_info = {
             'session_id': session_id,
             'analysis_count': user_data['analysis_count'],
             'generation_count': user_data['generation_count'],
             'total_usage': total_usage,
             'free_trial_limit': self.free_trial_limit,
             'remaining_free': remaining_free,
-            'is_premium': user_data.get('is_premium', False),
-            'can_use_feature': remaining_free > 0 or user_data.get('is_premium', False),
-            'reset_time_hours': int(time_until_reset.total_seconds() // 3600),
-            'reset_time_minutes': int((time_until_reset.total_seconds() % 3600) // 60),
-            'next_reset_ist': next_reset.strftime('%Y-%m-%d %H:%M:%S IST')
+            'is_premium': is_premium,
+            'can_use_feature': remaining_free > 0 or is_premium
         }
+        
+        # Premium users have no daily limit, so the reset countdown is only added for free users
+        if not is_premium:
+            # Calculate time until next reset (12:00 AM IST)
+            now_ist = datetime.now(IST)
+            next_reset = now_ist.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            time_until_reset = next_reset - now_ist
+            
+            usage_info['reset_time_hours'] = int(time_until_reset.total_seconds() // 3600)
+            usage_info['reset_time_minutes'] = int((time_until_reset.total_seconds() % 3600) // 60)
+            usage_info['next_reset_ist'] = next_reset.strftime('%Y-%m-%d %H:%M:%S IST')
+        self._set_request_usage_info(session_id, usage_info)
+        return usage_info
     
     def can_use_analysis(self, session_id: Optional[str] = None) -> Tuple[bool, str]:
         """Check if user can use analysis feature."""
@@ -143,97 +272,64 @@ class UsageService:
         if not session_id:
             session_id = self.get_session_id()
         
-        can_use, message = self.can_use_analysis(session_id)
-        if not can_use:
-            return False
-        
-        usage_data = self._load_usage_data()
-        
-        if session_id not in usage_data:
-            usage_data[session_id] = {
-                'analysis_count': 0,
-                'generation_count': 0,
-                'first_use': datetime.now().isoformat(),
-                'is_premium': False
-            }
-        
-        usage_data[session_id]['analysis_count'] += 1
-        usage_data[session_id]['last_use'] = datetime.now().isoformat()
-        
-        self._save_usage_data(usage_data)
-        return True
+        return self._record_usage(session_id, 'analysis_count')
     
     def record_generation_usage(self, session_id: Optional[str] = None) -> bool:
         """Record code generation usage and return success."""
         if not session_id:
             session_id = self.get_session_id()
         
-        can_use, message = self.can_use_analysis(session_id)  # Same limit for both features
-        if not can_use:
-            return False
-        
-        usage_data = self._load_usage_data()
-        
-        if session_id not in usage_data:
-            usage_data[session_id] = {
-                'analysis_count': 0,
-                'generation_count': 0,
-                'first_use': datetime.now().isoformat(),
-                'is_premium': False
-            }
-        
-        usage_data[session_id]['generation_count'] += 1
-        usage_data[session_id]['last_use'] = datetime.now().isoformat()
-        
-        self._save_usage_data(usage_data)
-        return True
+        return self._record_usage(session_id, 'generation_count')  # Same limit for both features
     
     def upgrade_to_premium(self, session_id: Optional[str] = None) -> bool:
         """Upgrade user to premium (placeholder for payment integration)."""
         if not session_id:
             session_id = self.get_session_id()
         
-        usage_data = self._load_usage_data()
-        
-        if session_id not in usage_data:
-            usage_data[session_id] = {
-                'analysis_count': 0,
-                'generation_count': 0,
-                'first_use': datetime.now().isoformat(),
-                'is_premium': False
-            }
-        
-        usage_data[session_id]['is_premium'] = True
-        usage_data[session_id]['premium_since'] = datetime.now().isoformat()
-        
-        self._save_usage_data(usage_data)
-        return True
+        self._set_request_usage_info(session_id, None)
+        try:
+            with self._connection() as conn:
+                self._insert_session(conn, session_id)
+                conn.execute('''
+                    UPDATE session_usage SET is_premium = 1, premium_since = ?
+                    WHERE session_id = ?
+                ''', (datetime.now().isoformat(), session_id))
+            return True
+        except Exception as e:
+            logger.error(f"Failed to upgrade session to premium: {e}")
+            return False
     
     def reset_free_trial(self, session_id: Optional[str] = None) -> bool:
         """Reset free trial for a session (admin function)."""
         if not session_id:
             session_id = self.get_session_id()
         
-        usage_data = self._load_usage_data()
-        
-        if session_id in usage_data:
-            usage_data[session_id]['analysis_count'] = 0
-            usage_data[session_id]['generation_count'] = 0
-            usage_data[session_id]['reset_date'] = datetime.now().isoformat()
-            
-            self._save_usage_data(usage_data)
-            return True
-        
-        return False
+        self._set_request_usage_info(session_id, None)
+        try:
+            with self._connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE session_usage
+                    SET analysis_count = 0, generation_count = 0, reset_date = ?
+                    WHERE session_id = ?
+                ''', (datetime.now().isoformat(), session_id))
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Failed to reset free trial: {e}")
+            return False
     
     def get_all_usage_stats(self) -> Dict:
         """Get overall usage statistics (admin function)."""
-        usage_data = self._load_usage_data()
-        
-        total_users = len(usage_data)
-        total_analyses = sum(user.get('analysis_count', 0) for user in usage_data.values())
-        total_generations = sum(user.get('generation_count', 0) for user in usage_data.values())
-        premium_users = sum(1 for user in usage_data.values() if user.get('is_premium', False))
+        try:
+            with self._connection() as conn:
+                row = conn.execute('''
+                    SELECT COUNT(*), COALESCE(SUM(analysis_count), 0),
+                           COALESCE(SUM(generation_count), 0), COALESCE(SUM(is_premium), 0)
+                    FROM session_usage
+                ''').fetchone()
+            total_users, total_analyses, total_generations, premium_users = row
+        except Exception as e:
+            logger.error(f"Failed to load usage stats: {e}")
+            total_users = total_analyses = total_generations = premium_users = 0
         
         return {
             'total_users': total_users,
@@ -12,6 +12,7 @@ def check_table():
     """Check the user_daily_usage table."""
     try:
         with sqlite3.connect(DB_PATH) as conn:
+            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
             # Check if table exists
@@ -27,14 +28,11 @@ def check_table():
             print("✅ user_daily_usage table exists!")
             
             # Show table structure
-            cursor.execute("PRAGMA table_info(user_daily_usage)")
-            columns = cursor.fetchall()
-            
             print("\nTable structure:")
             print("-" * 60)
-            for col in columns:
-                nullable = "NOT NULL" if col[3] else "NULL"
-                print(f"{col[1]:20} | {col[2]:15} | {nullable}")
+            for col in cursor.execute("PRAGMA table_info(user_daily_usage)"):
+                nullable = "NOT NULL" if col['notnull'] else "NULL"
+                print(f"{col['name']:20} | {col['type']:15} | {nullable}")
             print("-" * 60)
             
             # Show sample data
@@ -43,11 +41,9 @@ def check_table():
             print(f"\nRows in table: {count}")
             
             if count > 0:
-                cursor.execute("SELECT * FROM user_daily_usage LIMIT 5")
-                rows = cursor.fetchall()
                 print("\nSample data:")
-                for row in rows:
-                    print(row)
+                for row in cursor.execute("SELECT * FROM user_daily_usage LIMIT 5"):
+                    print(tuple(row))
             
     except Exception as e:
         print(f"❌ Error checking table: {str(e)}")
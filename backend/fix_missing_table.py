@@ -3,66 +3,70 @@
 Fix missing user_daily_usage table in the database.
 """
 
-import sqlite3
 import os
 import sys
-from datetime import datetime
 
 # Add the backend directory to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database.connection import DB_PATH
+from app.database.migration import backup_database, migration_connection
+
+# user_daily_usage columns as (name, type, not_null, extra); drives both the DDL and the printed structure
+COLUMNS = [
+    ("id", "INTEGER", False, "PRIMARY KEY AUTOINCREMENT"),
+    ("user_id", "INTEGER", True, ""),
+    ("usage_date", "DATE", True, ""),
+    ("ai_analysis_count", "INTEGER", False, "DEFAULT 0"),
+    ("code_generation_count", "INTEGER", False, "DEFAULT 0"),
+    ("created_at", "TIMESTAMP", False, "DEFAULT CURRENT_TIMESTAMP"),
+    ("updated_at", "TIMESTAMP", False, "DEFAULT CURRENT_TIMESTAMP"),
+]
+
+TABLE_CONSTRAINTS = [
+    "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+    "UNIQUE(user_id, usage_date)",
+]
+
+CREATE_TABLE_SQL = "CREATE TABLE IF NOT EXISTS user_daily_usage ({})".format(", ".join(
+    [" ".join(filter(None, (name, col_type, "NOT NULL" if not_null else "", extra)))
+     for name, col_type, not_null, extra in COLUMNS] + TABLE_CONSTRAINTS
+))
+
+def create_indexes(cursor):
+    """Create the user_daily_usage indexes; run after any rows are loaded so each is built in one pass."""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_daily_usage_user_date 
+        ON user_daily_usage(user_id, usage_date)
+    ''')
 
 def create_user_daily_usage_table():
     """Create the missing user_daily_usage table."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        # Sole owner of the file for the whole run, so hold the lock throughout
+        with migration_connection(exclusive=True) as conn:
             cursor = conn.cursor()
             
             print("Creating user_daily_usage table...")
             
-            # Check if table already exists
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='user_daily_usage'
-            """)
-            
-            if cursor.fetchone():
-                print("✓ user_daily_usage table already exists")
-                return True
+            # One transaction for the whole migration: a single commit, and nothing half-applied on error
+            cursor.execute("BEGIN IMMEDIATE")
             
-            # Create the user_daily_usage table
-            cursor.execute('''
-                CREATE TABLE user_daily_usage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    usage_date DATE NOT NULL,
-                    ai_analysis_count INTEGER DEFAULT 0,
-                    code_generation_count INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
-                    UNIQUE(user_id, usage_date)
-                )
-            ''')
+            # IF NOT EXISTS makes both statements no-ops on a database that already has them.
+            # Not executescript(): it would commit the open transaction before running.
+            cursor.execute(CREATE_TABLE_SQL)
             
-            # Create index for better performance
-            cursor.execute('''
-                CREATE INDEX idx_user_daily_usage_user_date 
-                ON user_daily_usage(user_id, usage_date)
-            ''')
+            # Any backfill of user_daily_usage rows goes here, before the index is built
+            create_indexes(cursor)
             
             conn.commit()
-            print("✅ user_daily_usage table created successfully!")
+            print("✅ user_daily_usage table is in place!")
             
             # Display table structure
-            cursor.execute("PRAGMA table_info(user_daily_usage)")
-            columns = cursor.fetchall()
-            
             print("\nTable structure:")
             print("-" * 50)
-            for col in columns:
-                print(f"{col[1]:20} | {col[2]:15} | {'NOT NULL' if col[3] else 'NULL'}")
+            for name, col_type, not_null, _ in COLUMNS:
+                print(f"{name:20} | {col_type:15} | {'NOT NULL' if not_null else 'NULL'}")
             print("-" * 50)
             
     except Exception as e:
@@ -71,21 +75,6 @@ def create_user_daily_usage_table():
     
     return True
 
-def backup_database():
-    """Create a backup of the database before updating."""
-    try:
-        backup_path = f"{DB_PATH}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        # Copy database file
-        import shutil
-        shutil.copy2(DB_PATH, backup_path)
-        
-        print(f"✓ Database backed up to: {backup_path}")
-        return backup_path
-    except Exception as e:
-        print(f"❌ Error creating backup: {str(e)}")
-        return None
-
 if __name__ == "__main__":
     print("🔄 Fixing missing user_daily_usage table...")
     print(f"Database path: {DB_PATH}")
@@ -100,6 +89,7 @@ if __name__ == "__main__":
     if not backup_path:
         print("❌ Failed to create backup. Aborting update.")
         sys.exit(1)
+    print(f"✓ Database backed up to: {backup_path}")
     
     # Create missing table
     if create_user_daily_usage_table():
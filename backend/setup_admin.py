@@ -9,23 +9,37 @@ import os
 # Add the backend directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app.database.connection import get_db_connection, init_database
+from app.database.connection import init_database
+from app.database.migration import migration_connection
 from app.models.user import User, UserRole
 from datetime import datetime
 
+INSERT_SQL = '''
+    INSERT INTO users 
+    (email, password_hash, first_name, last_name, role, is_active, email_verified, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(email) DO NOTHING
+'''
+
+def _serialize_user(user):
+    """Return the INSERT_SQL parameters for a user; pairs with executemany for bulk seeding."""
+    return (
+        user.email,
+        user.password_hash,
+        user.first_name,
+        user.last_name,
+        user.role.value,
+        user.is_active,
+        user.email_verified,
+        user.created_at.isoformat(),
+        user.updated_at.isoformat()
+    )
+
 def setup_admin():
     """Setup a default super admin account."""
     print("🚀 Setting up Super Admin Account")
     print("=" * 40)
     
-    # Initialize database first
-    try:
-        init_database()
-        print("✅ Database initialized")
-    except Exception as e:
-        print(f"❌ Error initializing database: {e}")
-        return False
-    
     # Default admin credentials
     admin_email = "admin@codeplatform.com"
     admin_password = "admin123"
@@ -33,18 +47,16 @@ def setup_admin():
     admin_last_name = "Admin"
     
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if admin already exists
-            cursor.execute("SELECT id FROM users WHERE email = ?", (admin_email,))
-            existing_admin = cursor.fetchone()
+        with migration_connection() as conn:
+            # Initialize database first, on the same connection used for the admin account
+            try:
+                init_database(conn)
+                print("✅ Database initialized")
+            except Exception as e:
+                print(f"❌ Error initializing database: {e}")
+                return False
             
-            if existing_admin:
-                print(f"✅ Super admin already exists with email: {admin_email}")
-                print(f"   User ID: {existing_admin['id']}")
-                print(f"   Password: {admin_password}")
-                return True
+            cursor = conn.cursor()
             
             # Create admin user
             admin_user = User.create_user(
@@ -55,22 +67,20 @@ def setup_admin():
                 role=UserRole.ADMIN
             )
             
-            # Insert into database
-            cursor.execute('''
-                INSERT INTO users 
-                (email, password_hash, first_name, last_name, role, is_active, email_verified, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                admin_user.email,
-                admin_user.password_hash,
-                admin_user.first_name,
-                admin_user.last_name,
-                admin_user.role.value,
-                admin_user.is_active,
-                True,  # Auto-verify admin email
-                admin_user.created_at.isoformat(),
-                admin_user.updated_at.isoformat()
-            ))
+            admin_user.email_verified = True  # Auto-verify admin email
+            
+            # Insert into database; an existing account with this email turns the insert into a no-op
+            cursor.execute(INSERT_SQL, _serialize_user(admin_user))
+            
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT id FROM users WHERE email = ?", (admin_email,))
+                existing_admin = cursor.fetchone()
+                conn.commit()
+                
+                print(f"✅ Super admin already exists with email: {admin_email}")
+                print(f"   User ID: {existing_admin['id']}")
+                print(f"   Password: {admin_password}")
+                return True
             
             user_id = cursor.lastrowid
             conn.commit()
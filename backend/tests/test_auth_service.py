@@ -0,0 +1,91 @@
+"""
+Tests for password verification and hash upgrades in the auth service.
+"""
+
+import sqlite3
+
+import bcrypt
+import pytest
+
+from app.database import connection
+from app.models.user import User
+from app.services.auth_service import AuthService
+
+# Without argon2-cffi new hashes stay bcrypt and nothing is upgraded
+pytest.importorskip('argon2')
+
+EMAIL = 'legacy@example.com'
+PASSWORD = 'correct horse battery staple'
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Point the app's SQLite helpers at a fresh, initialized database."""
+    path = str(tmp_path / 'app.db')
+    monkeypatch.setattr(connection, 'DB_PATH', path)
+    # Don't reuse a per-thread connection opened against another database
+    monkeypatch.setattr(connection._thread_local, 'write_conn', None, raising=False)
+    
+    conn = sqlite3.connect(path)
+    try:
+        connection.init_database(conn)
+    finally:
+        conn.close()
+    
+    yield path
+    
+    write_conn = getattr(connection._thread_local, 'write_conn', None)
+    if write_conn is not None:
+        write_conn.close()
+
+def _insert_user(path: str, password_hash: str):
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute(
+                'INSERT INTO users (email, password_hash, first_name, last_name, role) VALUES (?, ?, ?, ?, ?)',
+                (EMAIL, password_hash, 'Legacy', 'User', 'student')
+            )
+    finally:
+        conn.close()
+
+def _stored_hash(path: str) -> str:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT password_hash FROM users WHERE email = ?', (EMAIL,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_new_hashes_use_argon2():
+    password_hash = User.hash_password(PASSWORD)
+    
+    assert password_hash.startswith('$argon2id$')
+    assert User.verify_password_hash(PASSWORD, password_hash)
+    assert not User.password_needs_rehash(password_hash)
+
+def test_legacy_bcrypt_hash_verifies_and_is_upgraded_on_login(db_path):
+    legacy_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=4)).decode('utf-8')
+    _insert_user(db_path, legacy_hash)
+    assert User.password_needs_rehash(legacy_hash)
+    
+    success, message, user = AuthService().authenticate_user(EMAIL, PASSWORD)
+    
+    assert success, message
+    assert user.email == EMAIL
+    upgraded_hash = _stored_hash(db_path)
+    assert upgraded_hash.startswith('$argon2id$')
+    assert User.verify_password_hash(PASSWORD, upgraded_hash)
+    
+    # The upgraded hash keeps working for later logins
+    success, message, _ = AuthService().authenticate_user(EMAIL, PASSWORD)
+    assert success, message
+    assert _stored_hash(db_path) == upgraded_hash
+
+def test_wrong_password_leaves_legacy_hash_untouched(db_path):
+    legacy_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=4)).decode('utf-8')
+    _insert_user(db_path, legacy_hash)
+    
+    success, _, user = AuthService().authenticate_user(EMAIL, 'wrong password')
+    
+    assert not success
+    assert user is None
+    assert _stored_hash(db_path) == legacy_hash
@@ -0,0 +1,67 @@
+"""
+Tests for splitting a multi-file git diff into per-file results.
+"""
+
+import shutil
+import subprocess
+
+import pytest
+
+from app.services.git_service import GitService
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason="git is not installed")
+
+def _git(*args):
+    subprocess.run(['git', *args], check=True, capture_output=True)
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """A repository with one commit, used as the working directory."""
+    monkeypatch.chdir(tmp_path)
+    _git('init', '-q')
+    _git('config', 'user.email', 'tests@example.com')
+    _git('config', 'user.name', 'Tests')
+    for name in ('old.py', 'sp ace.py', 'é.py', 'gone.py', 'same.py'):
+        # Distinct contents, so rename detection can only pair old.py with new.py
+        (tmp_path / name).write_text(''.join(f'{name} line {i}\n' for i in range(20)), encoding='utf-8')
+    _git('add', '-A')
+    _git('commit', '-q', '-m', 'initial')
+    return tmp_path
+
+def _append(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+def test_sections_are_matched_to_their_files(repo):
+    _git('mv', 'old.py', 'new.py')
+    _append(repo / 'new.py', 'renamed\n')
+    _append(repo / 'sp ace.py', 'spaced\n')
+    _append(repo / 'é.py', 'quoted\n')
+    (repo / 'gone.py').unlink()
+    _git('add', '-A')
+    
+    paths = ['new.py', 'old.py', 'sp ace.py', 'é.py', 'gone.py', 'same.py']
+    results = GitService().get_current_diff_many(paths, staged=True)
+    
+    def added(path):
+        return [line.content for line in results[path].diff_lines if line.type == 'added']
+    
+    assert added('new.py') == ['renamed']
+    assert added('old.py') == ['renamed']
+    assert added('sp ace.py') == ['spaced']
+    assert added('é.py') == ['quoted']
+    assert results['gone.py'].removed_lines == 20
+    assert results['same.py'].success
+    assert not results['same.py'].has_changes
+
+def test_unstaged_changes_in_a_subdirectory(repo):
+    (repo / 'pkg').mkdir()
+    (repo / 'pkg' / 'mod.py').write_text('a\n', encoding='utf-8')
+    _git('add', '-A')
+    _git('commit', '-q', '-m', 'add pkg')
+    _append(repo / 'pkg' / 'mod.py', 'b\n')
+    
+    results = GitService().get_current_diff_many(['pkg/mod.py', 'same.py'])
+    
+    assert results['pkg/mod.py'].added_lines == 1
+    assert not results['same.py'].has_changes
@@ -0,0 +1,54 @@
+"""
+Tests for free-trial limits in the usage service.
+"""
+
+import importlib
+
+import pytest
+
+from app.services.usage_service import UsageService
+
+# The package re-exports the singleton under the module's name, so fetch the module itself
+usage_module = importlib.import_module('app.services.usage_service')
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """A UsageService backed by its own temporary database."""
+    monkeypatch.setattr(usage_module, 'USAGE_DB_PATH', str(tmp_path / 'usage.db'))
+    return UsageService()
+
+def test_usage_allowed_up_to_the_free_limit(service):
+    for _ in range(service.free_trial_limit):
+        assert service.can_use_analysis('session-a')[0]
+        assert service.record_analysis_usage('session-a')
+    
+    allowed, message = service.can_use_analysis('session-a')
+    assert not allowed
+    assert message.startswith('Daily limit reached')
+    assert service.get_usage_info('session-a')['remaining_free'] == 0
+
+def test_recording_past_the_limit_is_refused(service):
+    for _ in range(service.free_trial_limit):
+        assert service.record_generation_usage('session-b')
+    
+    assert not service.record_analysis_usage('session-b')
+    assert not service.record_generation_usage('session-b')
+    assert service.get_usage_info('session-b')['total_usage'] == service.free_trial_limit
+
+def test_limit_is_per_session(service):
+    for _ in range(service.free_trial_limit):
+        service.record_analysis_usage('session-c')
+    
+    assert not service.can_use_analysis('session-c')[0]
+    assert service.can_use_analysis('session-d')[0]
+
+def test_premium_is_never_limited(service):
+    assert service.upgrade_to_premium('session-e')
+    
+    for _ in range(service.free_trial_limit * 2):
+        assert service.record_analysis_usage('session-e')
+    
+    allowed, message = service.can_use_analysis('session-e')
+    assert allowed
+    assert message == 'Premium user'
+    assert service.get_usage_info('session-e')['can_use_feature']
@@ -6,31 +6,37 @@ Database schema update script to add AI analysis limits and convert currency to
 import sqlite3
 import os
 import sys
-from datetime import datetime
 
 # Add the backend directory to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database.connection import DB_PATH
+from app.database.migration import backup_database, migration_connection
 
 def update_database_schema():
     """Update database schema to add AI analysis limits and convert currency."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        # Sole owner of the file for the whole run, so hold the lock throughout
+        with migration_connection(exclusive=True) as conn:
             cursor = conn.cursor()
             
             print("Updating database schema...")
             
-            # Check if ai_analysis_limit column exists
-            cursor.execute("PRAGMA table_info(subscription_plans)")
-            columns = [column[1] for column in cursor.fetchall()]
+            # One transaction for the whole migration: a single commit, and nothing half-applied on error
+            cursor.execute("BEGIN IMMEDIATE")
             
-            if 'ai_analysis_limit' not in columns:
-                print("Adding ai_analysis_limit column to subscription_plans...")
+            # Add ai_analysis_limit; an existing column surfaces as a "duplicate column" error
+            try:
                 cursor.execute('''
                     ALTER TABLE subscription_plans 
                     ADD COLUMN ai_analysis_limit INTEGER DEFAULT 10
                 ''')
+            except sqlite3.OperationalError as e:
+                if 'duplicate column' not in str(e).lower():
+                    raise
+                print("✓ ai_analysis_limit column already exists")
+            else:
+                print("Adding ai_analysis_limit column to subscription_plans...")
                 
                 # Update existing plans with appropriate AI analysis limits
                 cursor.execute('''
@@ -43,47 +49,39 @@ def update_database_schema():
                     END
                 ''')
                 print("✓ Added ai_analysis_limit column and updated existing plans")
-            else:
-                print("✓ ai_analysis_limit column already exists")
             
-            # Update currency from USD to INR and convert prices
+            # Convert USD plans to INR (approximate rate: 1 USD = 83 INR) and default
+            # missing currencies to INR in a single pass over the table
             cursor.execute("SELECT id, price, currency FROM subscription_plans WHERE currency = 'USD'")
             usd_plans = cursor.fetchall()
             
+            cursor.execute('''
+                UPDATE subscription_plans 
+                SET price = CASE WHEN currency = 'USD' THEN price * 83.0 ELSE price END,
+                    currency = 'INR' 
+                WHERE currency IS NULL OR currency IN ('USD', '')
+            ''')
+            
             if usd_plans:
                 print(f"Converting {len(usd_plans)} plans from USD to INR...")
-                for plan_id, price, currency in usd_plans:
-                    # Convert USD to INR (approximate rate: 1 USD = 83 INR)
-                    inr_price = price * 83.0
-                    cursor.execute('''
-                        UPDATE subscription_plans 
-                        SET price = ?, currency = 'INR' 
-                        WHERE id = ?
-                    ''', (inr_price, plan_id))
-                    print(f"  Plan {plan_id}: ${price} USD → ₹{inr_price} INR")
+                print("\n".join(
+                    f"  Plan {plan_id}: ${price} USD → ₹{price * 83.0} INR"
+                    for plan_id, price, currency in usd_plans
+                ))
                 print("✓ Converted currency from USD to INR")
             else:
                 print("✓ No USD plans found to convert")
             
-            # Update default currency for new plans
+            # Update payments table currency if needed; rowcount reports how many were converted
             cursor.execute('''
-                UPDATE subscription_plans 
-                SET currency = 'INR' 
-                WHERE currency IS NULL OR currency = ''
+                UPDATE payments 
+                SET amount = amount * 83.0, currency = 'INR' 
+                WHERE currency = 'USD'
             ''')
-            
-            # Update payments table currency if needed
-            cursor.execute("SELECT COUNT(*) FROM payments WHERE currency = 'USD'")
-            usd_payments = cursor.fetchone()[0]
+            usd_payments = cursor.rowcount
             
             if usd_payments > 0:
-                print(f"Converting {usd_payments} payments from USD to INR...")
-                cursor.execute('''
-                    UPDATE payments 
-                    SET amount = amount * 83.0, currency = 'INR' 
-                    WHERE currency = 'USD'
-                ''')
-                print("✓ Converted payment amounts from USD to INR")
+                print(f"✓ Converted {usd_payments} payment amounts from USD to INR")
             else:
                 print("✓ No USD payments found to convert")
             
@@ -106,21 +104,6 @@ def update_database_schema():
     
     return True
 
-def backup_database():
-    """Create a backup of the database before updating."""
-    try:
-        backup_path = f"{DB_PATH}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        # Copy database file
-        import shutil
-        shutil.copy2(DB_PATH, backup_path)
-        
-        print(f"✓ Database backed up to: {backup_path}")
-        return backup_path
-    except Exception as e:
-        print(f"❌ Error creating backup: {str(e)}")
-        return None
-
 if __name__ == "__main__":
     print("🔄 Starting database schema update...")
     print(f"Database path: {DB_PATH}")
@@ -135,6 +118,7 @@ if __name__ == "__main__":
     if not backup_path:
         print("❌ Failed to create backup. Aborting update.")
         sys.exit(1)
+    print(f"✓ Database backed up to: {backup_path}")
     
     # Update schema
     if update_database_schema():